@@ -1,63 +1,179 @@
 import time
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 from urllib.parse import urljoin, urlparse
 import boto3
-import json
-import hashlib
+from botocore.config import Config
+import orjson
+import gzip
+import base64
+from pybloom_live import ScalableBloomFilter
+import threading
+from functools import lru_cache
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from url_canonical import generate_url_hash
 
 # AWS SQS Configuration
-sqs = boto3.client('sqs', region_name='us-east-1')
+# A single module-level client with a larger keep-alive pool, so per-URL sends reuse connections
+sqs = boto3.client('sqs', region_name='us-east-1', config=Config(
+    max_pool_connections=50,
+    tcp_keepalive=True,
+    retries={'mode': 'adaptive', 'max_attempts': 5}
+))
 crawler_queue_url = 'https://sqs.us-east-1.amazonaws.com/969510159350/crawler-queue.fifo'
 indexer_queue_url = 'https://sqs.us-east-1.amazonaws.com/969510159350/indexer-queue.fifo'
 crawler_result_queue_url = 'https://sqs.us-east-1.amazonaws.com/969510159350/crawler-result-queue.fifo'
 
+# SQS accepts at most 10 entries and 256 KB of message bodies per batch request
+SQS_BATCH_SIZE = 10
+MAX_BATCH_BYTES = 250_000
+
+# Crawl result fields also sent as message attributes; the master reads these instead of the body
+CRAWL_RESULT_ATTRIBUTES = ('url', 'url_hash', 'status', 'depth', 'seed_domain', 'status_code', 'content_length')
+
+# Indexer payloads larger than this are gzip-compressed and base64-encoded before sending
+COMPRESSION_THRESHOLD = 4096
+
+# Raw HTML forwarded to the indexer is capped so that, even incompressible, the
+# gzip+base64 body stays under SQS's 256 KB message limit
+MAX_INDEXER_HTML_BYTES = 150_000
+
+# Only the first MAX_PAGE_BYTES of a response body are downloaded and parsed
+MAX_PAGE_BYTES = 2_000_000
+DOWNLOAD_CHUNK_SIZE = 65536
+
+# Link targets that can never produce a crawlable URL
+NON_HTTP_HREF_PREFIXES = ('mailto:', 'javascript:', 'tel:')
+
+# Scheme, host and path of an absolute http(s) URL; query and fragment are left out
+URL_PARTS_RE = re.compile(r'^(https?)://([^/?#]+)([^?#]*)', re.IGNORECASE)
+
+# Number of pages fetched concurrently by one crawler process
+FETCH_WORKERS = 4
+# Minimum delay (seconds) between two requests to the same host
+CRAWL_DELAY = 1
+
+# Shared HTTP session so same-host fetches reuse TCP connections and TLS sessions
+http_session = requests.Session()
+http_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=Retry(total=2, backoff_factor=0.3))
+http_session.mount('http://', http_adapter)
+http_session.mount('https://', http_adapter)
+
+# Tasks received from SQS but not yet crawled
+_task_buffer = deque()
+
+# Indexer documents and crawl results waiting to be sent in the next batch request
+_indexer_entries = []
+_result_entries = []
+
+# URLs this process has already forwarded, so repeated links are dropped before reaching SQS
+_seen_urls = ScalableBloomFilter(initial_capacity=100_000, error_rate=1e-6)
+
+# Earliest time (time.monotonic) at which each host may be fetched again
+_host_next_fetch = {}
+_host_next_fetch_lock = threading.Lock()
+
 # Logging setup
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - Crawler - %(levelname)s - %(message)s')
+logger = logging.getLogger("crawler")
 
 def fetch_page(url):
+    """Download at most MAX_PAGE_BYTES of an HTML page and return (html, status_code, content_type), or None.
+
+    Non-HTML responses are not downloaded and come back with html set to None.
+    """
     headers = {
         'User-Agent': 'DistributedCrawlerBot/1.1 (+https://example.com/bot)'
     }
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        return response
+        with http_session.get(url, headers=headers, timeout=10, stream=True) as response:
+            response.raise_for_status()
+
+            content_type = response.headers.get('Content-Type', '')
+            if content_type and 'html' not in content_type.lower():
+                logger.info("Skipping non-HTML content at %s: %s", url, content_type)
+                return None, response.status_code, content_type
+
+            chunks = []
+            total_bytes = 0
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                chunks.append(chunk)
+                total_bytes += len(chunk)
+                if total_bytes >= MAX_PAGE_BYTES:
+                    logger.info("Truncated %s after %d bytes", url, total_bytes)
+                    break
+
+            body = b''.join(chunks)[:MAX_PAGE_BYTES]
+            try:
+                html = body.decode(response.encoding or 'utf-8', errors='replace')
+            except LookupError:
+                # Unknown charset announced by the server
+                html = body.decode('utf-8', errors='replace')
+            return html, response.status_code, content_type
     except requests.RequestException as e:
-        logging.error(f"Failed to fetch {url}: {e}")
+        logger.error("Failed to fetch %s: %s", url, e)
+        return None
+
+def wait_for_host(host):
+    """Reserve the host's next fetch slot and sleep only until that slot is due"""
+    with _host_next_fetch_lock:
+        now = time.monotonic()
+        fetch_at = max(now, _host_next_fetch.get(host, 0))
+        _host_next_fetch[host] = fetch_at + CRAWL_DELAY
+    if fetch_at > now:
+        time.sleep(fetch_at - now)
+
+def crawl_page(url):
+    """Politely fetch a page and extract its links; returns (html, status_code, content_type, urls) or None.
+
+    A non-HTML page has html set to None and no urls.
+
+    Runs on the fetch workers: every page gets its own Lexbor tree, so pages are
+    parsed on the worker threads instead of queueing behind the main loop.
+    """
+    wait_for_host(get_domain(url))
+    page = fetch_page(url)
+    if not page:
         return None
+    html, status_code, content_type = page
+    if html is None:
+        return None, status_code, content_type, []
+    return html, status_code, content_type, extract_urls(url, LexborHTMLParser(html))
 
-def parse_html(html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
-    title = soup.title.text.strip() if soup.title else "No Title"
-    body_text = soup.get_text(separator=' ', strip=True)
-    return title, body_text
-
-def extract_urls(base_url, html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
-    found_urls = set()
-    for link in soup.find_all('a', href=True):
-        full_url = urljoin(base_url, link['href'])
-        parsed = urlparse(full_url)
-        if parsed.scheme in ('http', 'https'):
-            normalized = parsed._replace(fragment='', query='').geturl()
-            found_urls.add(normalized)
-    return list(found_urls)
-
-def receive_task():
+def extract_urls(base_url, tree):
+    """Collect (url, domain) pairs for the normalized http(s) links of an already parsed page"""
+    # Relative links resolve against <base href> when the page declares one
+    base_node = tree.css_first('base[href]')
+    if base_node:
+        base_url = urljoin(base_url, base_node.attributes.get('href') or '')
+
+    found_urls = {}
+    for link in tree.css('a[href]'):
+        href = link.attributes.get('href')
+        # Cheap rejections before paying for urljoin
+        if not href or href[0] == '#' or href.startswith(NON_HTTP_HREF_PREFIXES):
+            continue
+        match = URL_PARTS_RE.match(urljoin(base_url, href))
+        if match:
+            found_urls[f"{match.group(1).lower()}://{match.group(2)}{match.group(3)}"] = match.group(2)
+    return list(found_urls.items())
+
+def refill_task_buffer():
+    """Long-poll up to 10 tasks into the local buffer and delete them from the queue in one batch"""
     response = sqs.receive_message(
         QueueUrl=crawler_queue_url,
-        MaxNumberOfMessages=1,
-        WaitTimeSeconds=10,
-        AttributeNames=['All'],
-        MessageAttributeNames=['All']
+        MaxNumberOfMessages=SQS_BATCH_SIZE,
+        WaitTimeSeconds=20
     )
-    if 'Messages' in response:
-        message = response['Messages'][0]
+    delete_entries = []
+    for message in response.get('Messages', []):
         try:
-            task_data = json.loads(message['Body'])
+            task_data = orjson.loads(message['Body'])
             url = task_data['url']
             # Extract depth information from the task
             depth = task_data.get('depth', 0)
@@ -65,38 +181,99 @@ def receive_task():
             depth_limit = task_data.get('depth_limit', 3)  # Default depth limit if not specified
             # Extract restricted patterns from the task
             restricted_patterns = task_data.get('restricted_patterns', [])
-            
-            receipt_handle = message['ReceiptHandle']
-            sqs.delete_message(QueueUrl=crawler_queue_url, ReceiptHandle=receipt_handle)
-            return url, depth, seed_domain, depth_limit, restricted_patterns
+
+            _task_buffer.append((url, depth, seed_domain, depth_limit, restricted_patterns))
+            delete_entries.append({'Id': str(len(delete_entries)), 'ReceiptHandle': message['ReceiptHandle']})
         except Exception as e:
-            logging.error(f"Malformed task: {e}")
-    return None, None, None, None, None
+            logger.error("Malformed task: %s", e)
+
+    if delete_entries:
+        sqs.delete_message_batch(QueueUrl=crawler_queue_url, Entries=delete_entries)
+
+def receive_tasks(max_tasks):
+    """Pop up to max_tasks buffered tasks, refilling the buffer from SQS when it is empty"""
+    if not _task_buffer:
+        refill_task_buffer()
+    tasks = []
+    while _task_buffer and len(tasks) < max_tasks:
+        tasks.append(_task_buffer.popleft())
+    return tasks
 
 def get_domain(url):
     """Extract the domain from a URL"""
     parsed = urlparse(url)
     return parsed.netloc
 
+@lru_cache(maxsize=64)
+def compile_restricted_patterns(restricted_patterns):
+    """Combine a task's restricted patterns into one compiled regex, so each URL is matched once"""
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in restricted_patterns))
+
 def is_restricted_url(url, restricted_patterns):
     if not restricted_patterns:
         return False
         
-    for pattern in restricted_patterns:
-        if re.match(pattern, url):
-            logging.info(f"URL '{url}' matches restricted pattern '{pattern}'")
-            return True
+    match = compile_restricted_patterns(tuple(restricted_patterns)).match(url)
+    if match:
+        logger.debug("URL '%s' matches restricted prefix '%s'", url, match.group(0))
+        return True
     return False
 
+def send_batch_request(queue_url, batch):
+    """Send one SendMessageBatch request, logging any entries that SQS rejects"""
+    entries = [dict(entry, Id=str(i)) for i, entry in enumerate(batch)]
+    if not queue_url.endswith('.fifo'):
+        # Standard queues reject FIFO-only parameters
+        for entry in entries:
+            entry.pop('MessageGroupId', None)
+            entry.pop('MessageDeduplicationId', None)
+    response = sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+    for failure in response.get('Failed', []):
+        logger.error("Failed to send batch entry %s to %s: %s", failure['Id'], queue_url, failure.get('Message', failure.get('Code')))
+
+def send_message_batch(queue_url, entries):
+    """Send entries to a queue in batches of at most SQS_BATCH_SIZE entries and MAX_BATCH_BYTES"""
+    batch = []
+    batch_bytes = 0
+    for entry in entries:
+        entry_bytes = len(entry['MessageBody'].encode())
+        if batch and (len(batch) == SQS_BATCH_SIZE or batch_bytes + entry_bytes > MAX_BATCH_BYTES):
+            send_batch_request(queue_url, batch)
+            batch = []
+            batch_bytes = 0
+        batch.append(entry)
+        batch_bytes += entry_bytes
+    if batch:
+        send_batch_request(queue_url, batch)
+
+def flush_send_buffers():
+    """Send all buffered indexer documents and crawl results"""
+    send_message_batch(indexer_queue_url, _indexer_entries)
+    send_message_batch(crawler_result_queue_url, _result_entries)
+    _indexer_entries.clear()
+    _result_entries.clear()
+
+def buffer_entry(buffer, entry):
+    """Add an entry to a send buffer, flushing the buffers once it holds a full batch"""
+    buffer.append(entry)
+    if len(buffer) >= SQS_BATCH_SIZE:
+        flush_send_buffers()
+
 def send_urls_to_crawler_queue(urls, current_depth, seed_domain, depth_limit, restricted_patterns):
-    """Send URLs to the crawler queue with depth information"""
+    """Send (url, domain) pairs to the crawler queue with depth information"""
     next_depth = current_depth + 1
     # Only send URLs that haven't exceeded the depth limit
     if next_depth <= depth_limit:
-        for url in urls:
+        task_entries = []
+        for url, url_domain in urls:
+            # Skip URLs this crawler has already forwarded
+            if url in _seen_urls:
+                continue
+            _seen_urls.add(url)
+
             # Skip restricted URLs
             if is_restricted_url(url, restricted_patterns):
-                logging.info(f"Skipping restricted URL: {url}")
+                logger.debug("Skipping restricted URL: %s", url)
                 # Send restricted status to result queue for tracking
                 send_crawl_result({
                     "url": url,
@@ -106,133 +283,172 @@ def send_urls_to_crawler_queue(urls, current_depth, seed_domain, depth_limit, re
                     "seed_domain": seed_domain
                 })
                 continue
-                
-            url_domain = get_domain(url)
+
             # Only process URLs from the same domain as the seed
             if url_domain == seed_domain:
-                url_hash = hashlib.sha256(url.encode()).hexdigest()
-                sqs.send_message(
-                    QueueUrl=crawler_queue_url,
-                    MessageBody=json.dumps({
+                task_entries.append({
+                    'MessageBody': orjson.dumps({
                         'url': url,
                         'depth': next_depth,
                         'seed_domain': seed_domain,
                         'depth_limit': depth_limit,
                         'restricted_patterns': restricted_patterns  # Pass restricted patterns to next tasks
-                    }),
-                    MessageGroupId='crawler_tasks',
-                    MessageDeduplicationId=url_hash
-                )
-                logging.debug(f"Sent URL to crawler queue: {url} (depth: {next_depth})")
+                    }).decode(),
+                    'MessageGroupId': url_domain or 'default',  # Per-domain group: ordered within a domain, parallel across domains
+                    'MessageDeduplicationId': generate_url_hash(url)
+                })
+                logger.debug("Queued URL for crawler queue: %s (depth: %s)", url, next_depth)
             else:
-                logging.debug(f"Skipping URL from different domain: {url}")
+                logger.debug("Skipping URL from different domain: %s", url)
+
+        send_message_batch(crawler_queue_url, task_entries)
+        logger.debug("Sent %d URLs to crawler queue", len(task_entries))
     else:
-        logging.info(f"Reached depth limit ({depth_limit}). Skipping {len(urls)} URLs.")
+        logger.info("Reached depth limit (%s). Skipping %d URLs.", depth_limit, len(urls))
 
 def send_to_indexer(document):
-    sqs.send_message(
-        QueueUrl=indexer_queue_url,
-        MessageBody=json.dumps(document),
-        MessageGroupId='indexer_tasks',
-        MessageDeduplicationId=document['url_hash']
-    )
-    logging.info(f"Sent document to indexer queue: {document['url']}")
+    body = orjson.dumps(document)
+    message_attributes = {}
+    if len(body) > COMPRESSION_THRESHOLD:
+        body = base64.b64encode(gzip.compress(body, compresslevel=1))
+        message_attributes['encoding'] = {'DataType': 'String', 'StringValue': 'gzip+b64'}
+
+    buffer_entry(_indexer_entries, {
+        'MessageBody': body.decode(),
+        'MessageAttributes': message_attributes,
+        'MessageGroupId': 'indexer_tasks',
+        'MessageDeduplicationId': document['url_hash']
+    })
+    logger.info("Queued document for indexer: %s", document['url'])
 
 def send_crawl_result(payload):
-    sqs.send_message(
-        QueueUrl=crawler_result_queue_url,
-        MessageBody=json.dumps(payload),
-        MessageGroupId='crawler_results',
-        MessageDeduplicationId=payload['url_hash']
-    )
-    logging.info(f"Sent crawl result for: {payload['url']}")
+    # The scalars the master reads are repeated as message attributes, so it need not decode the body;
+    # SQS rejects empty attribute values, so those are left to the body
+    message_attributes = {}
+    for name in CRAWL_RESULT_ATTRIBUTES:
+        value = payload.get(name)
+        if isinstance(value, int):
+            message_attributes[name] = {'DataType': 'Number', 'StringValue': str(value)}
+        elif value:
+            message_attributes[name] = {'DataType': 'String', 'StringValue': value}
+
+    buffer_entry(_result_entries, {
+        'MessageBody': orjson.dumps(payload).decode(),
+        'MessageAttributes': message_attributes,
+        'MessageGroupId': 'crawler_results',
+        'MessageDeduplicationId': payload['url_hash']
+    })
+    logger.info("Queued crawl result for: %s", payload['url'])
 
-def generate_url_hash(url):
-    return hashlib.sha256(url.encode()).hexdigest()
 
 def crawler_process():
     idle_counter = 0
 
-    while True:
-        url, depth, seed_domain, depth_limit, restricted_patterns = receive_task()
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        while True:
+            tasks = receive_tasks(FETCH_WORKERS)
 
-        if not url:
-            idle_counter += 1
-            logging.info(f"No task received. Idle count: {idle_counter}")
-            if idle_counter >= 30:
-                logging.info("No tasks for a while. Shutting down.")
-                break
-            time.sleep(10)
-            continue
+            if not tasks:
+                # Nothing new is coming in, so send whatever is still buffered
+                flush_send_buffers()
+                idle_counter += 1
+                logger.info("No task received. Idle count: %d", idle_counter)
+                if idle_counter >= 30:
+                    logger.info("No tasks for a while. Shutting down.")
+                    break
+                time.sleep(10)
+                continue
 
-        idle_counter = 0
-        
-        # Check if the URL is restricted
-        if is_restricted_url(url, restricted_patterns):
-            logging.info(f"Skipping restricted URL: {url}")
-            send_crawl_result({
-                "url": url,
-                "url_hash": generate_url_hash(url),
-                "status": "restricted",
-                "depth": depth,
-                "seed_domain": seed_domain
-            })
-            continue
-            
-        logging.info(f"Crawling: {url} (depth: {depth}/{depth_limit}, domain: {seed_domain})")
-
-        response = fetch_page(url)
-        if not response:
-            send_crawl_result({
-                "url": url,
-                "url_hash": generate_url_hash(url),
-                "status": "error",
-                "error": "Failed to fetch",
-                "depth": depth,
-                "seed_domain": seed_domain
-            })
-            continue
+            idle_counter = 0
+
+            # Fetch and parse the whole batch concurrently; results are forwarded as each page completes
+            pending_fetches = {}
+            for task in tasks:
+                url, depth, seed_domain, depth_limit, restricted_patterns = task
+
+                # Check if the URL is restricted
+                if is_restricted_url(url, restricted_patterns):
+                    logger.info("Skipping restricted URL: %s", url)
+                    send_crawl_result({
+                        "url": url,
+                        "url_hash": generate_url_hash(url),
+                        "status": "restricted",
+                        "depth": depth,
+                        "seed_domain": seed_domain
+                    })
+                    continue
+
+                logger.info("Crawling: %s (depth: %s/%s, domain: %s)", url, depth, depth_limit, seed_domain)
+                pending_fetches[executor.submit(crawl_page, url)] = task
+
+            for future in as_completed(pending_fetches):
+                url, depth, seed_domain, depth_limit, restricted_patterns = pending_fetches[future]
+
+                page = future.result()
+                if not page:
+                    send_crawl_result({
+                        "url": url,
+                        "url_hash": generate_url_hash(url),
+                        "status": "error",
+                        "error": "Failed to fetch",
+                        "depth": depth,
+                        "seed_domain": seed_domain
+                    })
+                    continue
+
+                # Only links are extracted by the crawler; title and text extraction happen in the indexer
+                html, status_code, content_type, extracted_urls = page
+                if html is None:
+                    send_crawl_result({
+                        "url": url,
+                        "url_hash": generate_url_hash(url),
+                        "status": "skipped",
+                        "reason": "non-HTML",
+                        "content_type": content_type,
+                        "depth": depth,
+                        "seed_domain": seed_domain
+                    })
+                    continue
+                content_length = len(html)
+                timestamp = time.time()
+
+                # Send new URLs back to crawler queue with updated depth
+                send_urls_to_crawler_queue(extracted_urls, depth, seed_domain, depth_limit, restricted_patterns)
+
+                # Create document for indexer
+                html_bytes = html.encode('utf-8')
+                if len(html_bytes) > MAX_INDEXER_HTML_BYTES:
+                    html = html_bytes[:MAX_INDEXER_HTML_BYTES].decode('utf-8', errors='ignore')
+
+                url_hash = generate_url_hash(url)
+                doc = {
+                    "url": url,
+                    "url_hash": url_hash,
+                    "html": html,
+                    "content_type": content_type,  # Response Content-Type header, used by the indexer
+                    "timestamp": timestamp,
+                    "depth": depth,
+                    "seed_domain": seed_domain
+                }
+
+                # Send document to indexer queue
+                send_to_indexer(doc)
+
+                # Send crawl result to crawler result queue
+                result_payload = {
+                    "url": url,
+                    "url_hash": url_hash,
+                    "status": "success",
+                    "status_code": status_code,
+                    "content_length": content_length,
+                    "extracted_urls_count": len(extracted_urls),
+                    "timestamp": timestamp,
+                    "depth": depth,
+                    "seed_domain": seed_domain
+                }
+                send_crawl_result(result_payload)
 
-        html = response.text
-        status_code = response.status_code
-        content_length = len(html)
-        timestamp = time.time()
-
-        title, content = parse_html(html)
-        extracted_urls = extract_urls(url, html)
-
-        # Send new URLs back to crawler queue with updated depth
-        send_urls_to_crawler_queue(extracted_urls, depth, seed_domain, depth_limit, restricted_patterns)
-
-        # Create document for indexer
-        url_hash = generate_url_hash(url)
-        doc = {
-            "url": url,
-            "url_hash": url_hash,
-            "title": title,
-            "content": content[:1000],
-            "timestamp": timestamp,
-            "depth": depth,
-            "seed_domain": seed_domain
-        }
-
-        # Send document to indexer queue
-        send_to_indexer(doc)
-
-        # Send crawl result to crawler result queue
-        result_payload = {
-            "url": url,
-            "url_hash": url_hash,
-            "status": "success",
-            "status_code": status_code,
-            "content_length": content_length,
-            "extracted_urls_count": len(extracted_urls),
-            "timestamp": timestamp,
-            "depth": depth,
-            "seed_domain": seed_domain
-        }
-        send_crawl_result(result_payload)
-        time.sleep(1)  
+    flush_send_buffers()
 
 if __name__ == '__main__':
     crawler_process()
\ No newline at end of file
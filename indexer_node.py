@@ -1,38 +1,95 @@
 import time
 import logging
-import json
+import orjson
 import os
+import io
+import csv
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 import hashlib
+import gzip
+import base64
 import shutil
 import psycopg2
 from psycopg2 import sql
-from psycopg2.extras import DictCursor
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
 from datetime import datetime
+from collections import Counter
+from multiprocessing import Pool
 from whoosh.index import create_in, open_dir
 from whoosh.fields import Schema, TEXT, ID, DATETIME, KEYWORD, STORED
 from whoosh.analysis import StemmingAnalyzer, CharsetFilter, RegexTokenizer
 from whoosh.support.charset import accent_map
 from whoosh.qparser import QueryParser, MultifieldParser, OrGroup, FuzzyTermPlugin, PhrasePlugin
+from whoosh.query import Term, And
 import whoosh.index as index
 from urllib.parse import urlparse
 import re
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 
 # AWS SQS Configuration
-sqs = boto3.client('sqs', region_name='us-east-1')
+# Queues may be FIFO (.fifo) or standard; indexing is idempotent (Whoosh update_document and
+# PostgreSQL ON CONFLICT on url), so standard queues' at-least-once, unordered delivery is safe
+# A single module-level client with a larger keep-alive pool, so connections survive the long-poll gaps
+sqs = boto3.client('sqs', region_name='us-east-1', config=Config(
+    max_pool_connections=32,
+    tcp_keepalive=True,
+    retries={'mode': 'adaptive', 'max_attempts': 5}
+))
 indexer_queue_url = 'https://sqs.us-east-1.amazonaws.com/969510159350/indexer-queue.fifo'
 indexer_result_queue_url = 'https://sqs.us-east-1.amazonaws.com/969510159350/indexer-result-queue.fifo'
 
-# RDS PostgreSQL Configuration
+# RDS PostgreSQL Configuration; the standard libpq environment variables override the defaults.
+# The password comes from PGPASSWORD or ~/.pgpass (a None password lets libpq read the latter).
 DB_CONFIG = {
-    'host': 'dbdistproj-new.c8v2o28aq6x6.us-east-1.rds.amazonaws.com',
-    'dbname': 'dbdistproj',
-    'user': 'bialy',
-    'password': 'midomido15', 
-    'port': 5432
+    'host': os.environ.get('PGHOST', 'dbdistproj-new.c8v2o28aq6x6.us-east-1.rds.amazonaws.com'),
+    'dbname': os.environ.get('PGDATABASE', 'dbdistproj'),
+    'user': os.environ.get('PGUSER', 'bialy'),
+    'password': os.environ.get('PGPASSWORD'),
+    'port': int(os.environ.get('PGPORT', 5432)),
+    'sslmode': os.environ.get('PGSSLMODE', 'require'),
+    'application_name': 'indexer_node',  # Identifies the indexer in pg_stat_activity/pg_stat_statements
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'tcp_user_timeout': 10000  # milliseconds; dead pooled connections fail fast
 }
 
+# PostgreSQL connections are pooled; the pool is created on first use
+DB_POOL_MIN_CONN = 1
+DB_POOL_MAX_CONN = 8
+_db_pool = None
+
+# Merges the per-batch staging table; run as a plain statement because the TEMP table is
+# recreated every transaction and a prepared plan against it would be replanned each time.
+# A URL may appear twice in one batch; keep its latest version so the upsert touches each row once
+MERGE_STAGED_DOCUMENTS_SQL = """
+    INSERT INTO indexed_documents 
+    (url, domain, title, summary, content_type, keywords, timestamp, last_updated, index_status)
+    SELECT DISTINCT ON (url)
+    url, domain, title, summary, content_type, keywords, timestamp, last_updated, index_status
+    FROM staging_documents
+    ORDER BY url, last_updated DESC
+    ON CONFLICT (url) DO UPDATE SET
+    domain = EXCLUDED.domain,
+    title = EXCLUDED.title,
+    summary = EXCLUDED.summary,
+    content_type = EXCLUDED.content_type,
+    keywords = EXCLUDED.keywords,
+    last_updated = EXCLUDED.last_updated,
+    index_status = EXCLUDED.index_status
+"""
+
+# Counts one search of a term
+UPSERT_SEARCH_STATISTICS_SQL = """
+    INSERT INTO search_statistics (search_term, search_count, last_searched)
+    VALUES (%s, 1, %s)
+    ON CONFLICT (search_term) DO UPDATE SET
+    search_count = search_statistics.search_count + 1,
+    last_searched = EXCLUDED.last_searched
+"""
+
 # Logging setup
 logging.basicConfig(
     level=logging.INFO,
@@ -46,15 +103,55 @@ logger = logging.getLogger("indexer")
 
 # Constants
 INDEX_DIR = "search_index"
-MAX_IDLE_COUNT = 30
-PROCESSING_DELAY = 3
+MAX_IDLE_SECONDS = 600  # Wall time without tasks before shutting down, whatever the poll and backoff lengths
 BACKOFF_TIME = 10
+MAX_BACKOFF_TIME = 60  # Upper bound for the idle sleep once the queue is known to be empty
+QUEUE_DEPTH_CHECK_INTERVAL = 5  # Empty polls between ApproximateNumberOfMessages checks
 MAX_RETRIES = 3
+SQS_BATCH_SIZE = 10  # Maximum messages per SQS receive/delete batch
+INDEX_BATCH_SIZE = 50  # Documents per Whoosh commit
+INDEX_FLUSH_INTERVAL = 5  # Seconds before a partial batch is committed anyway
+
+# A FIFO queue hands out nothing more from a message group while its messages are in flight,
+# so on FIFO queues each received batch is committed before the next receive
+INDEXER_QUEUE_IS_FIFO = indexer_queue_url.endswith('.fifo')
+INDEX_WRITER_LIMITMB = 128  # Memory per Whoosh writer process before it spills to disk
+# Processes analyzing documents within one commit; capped since the content Pool shares the CPUs,
+# and small commits use a single process because forking sub-writers costs more than it saves
+INDEX_WRITER_PROCS = min(4, os.cpu_count() or 1)
+INDEX_PARALLEL_MIN_DOCS = 200  # Smallest commit that uses INDEX_WRITER_PROCS
+INDEX_OPTIMIZE_INTERVAL = 500  # Indexed documents between segment merges
+CONTENT_WORKERS = os.cpu_count() or 1  # Processes running process_content for a received batch
+CONTENT_MAX_CHARS = 1000  # Body text kept per page for indexing and summaries
+
+# Document types for the MIME types the crawler may report; it only forwards HTML pages
+MIME_CONTENT_TYPES = {
+    'text/html': 'html',
+    'application/xhtml+xml': 'html'
+}
+
+# Keyword extraction: word tokens, ignored words and the suffixes removed by basic stemming
+KEYWORD_TOKEN_RE = re.compile(r'\w{3,}')
+KEYWORD_SUFFIX_RE = re.compile(r'(?:ing|ed|(?<!s)s)$')
+KEYWORD_STOP_WORDS = frozenset([
+    'the', 'and', 'is', 'in', 'to', 'of', 'a', 'for', 'with', 'on', 'at', 'from',
+    'by', 'an', 'that', 'this', 'be', 'are', 'as', 'it', 'its', 'or', 'was', 'were',
+    'has', 'have', 'had', 'not', 'what', 'when', 'where', 'who', 'how', 'why',
+    'but', 'if', 'because', 'as', 'until', 'while', 'than'
+])
+
+# Summaries: whitespace runs are collapsed and text is split at sentence ends
+WHITESPACE_RE = re.compile(r'\s+')
+SENTENCE_BREAK_RE = re.compile(r'(?<=[.!?])\s+')
 
 # Add a version file to track schema version
-SCHEMA_VERSION = "1.2"  # Incremented for PostgreSQL integration
+SCHEMA_VERSION = "1.3"  # Incremented when page content stopped being stored
 SCHEMA_VERSION_FILE = os.path.join(INDEX_DIR, "schema_version.txt")
 
+# Query parser and searcher reused across searches instead of being rebuilt per request
+_search_parser = None
+_searcher = None
+
 def create_custom_analyzer():
     """Create a custom analyzer with stemming and accent handling"""
     # Create a stemming analyzer that also handles accents
@@ -63,6 +160,20 @@ def create_custom_analyzer():
     my_analyzer = my_analyzer | CharsetFilter(accent_map)
     return my_analyzer
 
+# Enhanced schema with more field types and better analyzers, built once per process
+INDEX_ANALYZER = create_custom_analyzer()
+INDEX_SCHEMA = Schema(
+    url=ID(stored=True, unique=True),
+    domain=KEYWORD(stored=True, commas=True),  # Store domain for filtering
+    title=TEXT(stored=True, analyzer=INDEX_ANALYZER),
+    content=TEXT(stored=False, analyzer=INDEX_ANALYZER),  # Searchable only; results show the summary
+    keywords=KEYWORD(stored=True, commas=True),  # For extracted keywords
+    summary=STORED,  # Store a content summary
+    content_type=KEYWORD(stored=True),  # Document type (html, pdf, etc)
+    timestamp=DATETIME(stored=True),
+    last_updated=DATETIME(stored=True)
+)
+
 def setup_index():
     """Initialize or open the search index with an enhanced schema"""
     if not os.path.exists(INDEX_DIR):
@@ -103,23 +214,8 @@ def setup_index():
         except Exception as e:
             logger.error(f"Error during index recreation: {e}")
 
-    # Enhanced schema with more field types and better analyzers
-    analyzer = create_custom_analyzer()
-    
-    schema = Schema(
-        url=ID(stored=True, unique=True),
-        domain=KEYWORD(stored=True, commas=True),  # Store domain for filtering
-        title=TEXT(stored=True, analyzer=analyzer),
-        content=TEXT(stored=True, analyzer=analyzer),
-        keywords=KEYWORD(stored=True, commas=True),  # For extracted keywords
-        summary=STORED,  # Store a content summary
-        content_type=KEYWORD(stored=True),  # Document type (html, pdf, etc)
-        timestamp=DATETIME(stored=True),
-        last_updated=DATETIME(stored=True)
-    )
-
     if not index.exists_in(INDEX_DIR):
-        idx = create_in(INDEX_DIR, schema)
+        idx = create_in(INDEX_DIR, INDEX_SCHEMA)
         logger.info(f"Created new index in {INDEX_DIR}")
         
         # Write version file
@@ -136,43 +232,76 @@ def setup_index():
 
     return idx
 
+@contextmanager
+def db_connection():
+    """Borrow a connection from the PostgreSQL pool and return it when done"""
+    global _db_pool
+    if _db_pool is None:
+        _db_pool = ThreadedConnectionPool(DB_POOL_MIN_CONN, DB_POOL_MAX_CONN, **DB_CONFIG)
+    conn = _db_pool.getconn()
+    try:
+        yield conn
+    finally:
+        # Discard anything left uncommitted so the next borrower starts with a clean transaction
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        _db_pool.putconn(conn, close=bool(conn.closed))
+
 def setup_database():
     """Initialize PostgreSQL database tables if they don't exist"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
-        # Create tables if they don't exist
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS indexed_documents (
-            id SERIAL PRIMARY KEY,
-            url TEXT UNIQUE NOT NULL,
-            domain TEXT NOT NULL,
-            title TEXT,
-            summary TEXT,
-            content_type TEXT,
-            keywords TEXT,
-            timestamp TIMESTAMP,
-            last_updated TIMESTAMP,
-            index_status TEXT
-        )
-        """)
-        
-        # Create table for search statistics
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS search_statistics (
-            id SERIAL PRIMARY KEY,
-            search_term TEXT NOT NULL,
-            search_count INTEGER DEFAULT 1,
-            last_searched TIMESTAMP
-        )
-        """)
-        
-        conn.commit()
-        logger.info("Database tables initialized successfully")
-        
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Create tables if they don't exist
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS indexed_documents (
+                id SERIAL PRIMARY KEY,
+                url TEXT UNIQUE NOT NULL,
+                domain TEXT NOT NULL,
+                title TEXT,
+                summary TEXT,
+                content_type TEXT,
+                keywords TEXT,
+                timestamp TIMESTAMP,
+                last_updated TIMESTAMP,
+                index_status TEXT
+            )
+            """)
+            
+            # Create table for search statistics
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS search_statistics (
+                id SERIAL PRIMARY KEY,
+                search_term TEXT NOT NULL,
+                search_count INTEGER DEFAULT 1,
+                last_searched TIMESTAMP
+            )
+            """)
+            
+            # ON CONFLICT (search_term) needs a unique index to infer the conflict target
+            cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_search_statistics_search_term
+            ON search_statistics (search_term)
+            """)
+            
+            # Indexes for the domain and content type filters and breakdowns
+            cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_indexed_documents_domain
+            ON indexed_documents (domain)
+            """)
+            cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_indexed_documents_content_type
+            ON indexed_documents (content_type)
+            """)
+            
+            conn.commit()
+            logger.info("Database tables initialized successfully")
+            
+            cursor.close()
         return True
     except Exception as e:
         logger.error(f"Database initialization error: {e}")
@@ -193,14 +322,13 @@ def extract_keywords(content, max_keywords=10):
     # Check if the content is HTML and extract text more intelligently
     if content.strip().startswith('<') and '>' in content:
         try:
-            soup = BeautifulSoup(content, 'html.parser')
+            tree = LexborHTMLParser(content)
             
             # Give higher weight to words in headings and emphasized text
-            important_tags = soup.find_all(['h1', 'h2', 'h3', 'strong', 'b', 'em'])
-            important_text = ' '.join([tag.get_text() for tag in important_tags])
+            important_text = ' '.join(node.text() for node in tree.css('h1, h2, h3, strong, b, em'))
             
             # Get regular content
-            regular_text = soup.get_text()
+            regular_text = tree.body.text(separator=' ') if tree.body else ''
             
             # Combine with extra weight to important text
             text = regular_text + ' ' + important_text * 3
@@ -210,53 +338,54 @@ def extract_keywords(content, max_keywords=10):
     else:
         text = content
     
-    # Convert to lowercase and remove common punctuation
-    text = re.sub(r'[^\w\s]', ' ', text.lower())
-    
-    # Extended stop words list
-    stop_words = set([
-        'the', 'and', 'is', 'in', 'to', 'of', 'a', 'for', 'with', 'on', 'at', 'from',
-        'by', 'an', 'that', 'this', 'be', 'are', 'as', 'it', 'its', 'or', 'was', 'were',
-        'has', 'have', 'had', 'not', 'what', 'when', 'where', 'who', 'how', 'why',
-        'but', 'if', 'because', 'as', 'until', 'while', 'than'
-    ])
-    
-    # Filter and normalize words
-    words = []
-    for word in text.split():
-        if word not in stop_words and len(word) > 2:
-            # Basic stemming (could use a proper stemmer from NLTK in production)
-            if word.endswith('ing'):
-                word = word[:-3]
-            elif word.endswith('s') and not word.endswith('ss'):
-                word = word[:-1]
-            elif word.endswith('ed'):
-                word = word[:-2]
-            words.append(word)
+    # Count word tokens (runs of 3+ word characters) in C before any per-word work
+    token_counts = Counter(KEYWORD_TOKEN_RE.findall(text.lower()))
     
-    # Count word frequencies
-    word_freq = {}
-    for word in words:
-        word_freq[word] = word_freq.get(word, 0) + 1
+    # Filter and normalize the distinct words, merging counts of words with the same stem
+    # (basic stemming; could use a proper stemmer from NLTK in production)
+    word_freq = Counter()
+    for word, count in token_counts.items():
+        if word not in KEYWORD_STOP_WORDS:
+            word_freq[KEYWORD_SUFFIX_RE.sub('', word)] += count
     
-    # Sort by frequency and take top keywords
-    sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-    keywords = [word for word, _ in sorted_words[:max_keywords]]
+    # Take the most frequent words as keywords
+    keywords = [word for word, _ in word_freq.most_common(max_keywords)]
     
     return keywords
 
+def extract_page_text(html_content, max_chars=CONTENT_MAX_CHARS):
+    """Extract the title and leading body text from a crawled HTML page"""
+    tree = LexborHTMLParser(html_content)
+    title_node = tree.css_first('title')
+    title = title_node.text(strip=True) if title_node else "No Title"
+
+    # Collect text nodes only until max_chars is reached instead of joining the whole body
+    pieces = []
+    length = 0
+    if tree.body:
+        for node in tree.body.traverse(include_text=True):
+            if node.tag != '-text':
+                continue
+            text = (node.text_content or '').strip()
+            if text:
+                pieces.append(text)
+                length += len(text) + 1
+                if length > max_chars:
+                    break
+    return title, ' '.join(pieces)[:max_chars]
+
 def generate_summary(content, max_length=200):
     """Generate a short summary of the content"""
     if not content:
         return "No content available"
     
     # Simple summary: first few sentences or characters
-    content = re.sub(r'\s+', ' ', content).strip()
+    content = WHITESPACE_RE.sub(' ', content).strip()
     if len(content) <= max_length:
         return content
     
     # Try to break at a sentence
-    sentences = re.split(r'(?<=[.!?])\s+', content[:max_length+100])
+    sentences = SENTENCE_BREAK_RE.split(content[:max_length+100])
     summary = ""
     for sentence in sentences:
         if len(summary + sentence) <= max_length:
@@ -269,40 +398,101 @@ def generate_summary(content, max_length=200):
     
     return summary.strip() + "..."
 
-def receive_task():
-    """Receive a task from the SQS queue with error handling"""
+def decode_message_body(message):
+    """Decode a message body, inflating payloads that the crawler sent gzip-compressed"""
+    body = message['Body']
+    encoding = message.get('MessageAttributes', {}).get('encoding', {}).get('StringValue')
+    if encoding == 'gzip+b64':
+        body = gzip.decompress(base64.b64decode(body))
+    return orjson.loads(body)
+
+def receive_tasks():
+    """Receive up to 10 tasks from the SQS queue; returns a list of (data, receipt_handle)"""
+    tasks = []
     try:
         response = sqs.receive_message(
             QueueUrl=indexer_queue_url,
-            MaxNumberOfMessages=1,
-            WaitTimeSeconds=10,
-            AttributeNames=['All'],
-            MessageAttributeNames=['All']
+            MaxNumberOfMessages=SQS_BATCH_SIZE,
+            WaitTimeSeconds=20,
+            MessageAttributeNames=['encoding']  # Only the compression marker is read
         )
         
-        if 'Messages' in response:
-            message = response['Messages'][0]
+        malformed_receipts = []
+        for message in response.get('Messages', []):
             try:
-                data = json.loads(message['Body'])
-            except json.JSONDecodeError as e:
-                logger.error(f"Invalid JSON in message: {e}")
+                data = decode_message_body(message)
+            except (ValueError, OSError) as e:
+                logger.error(f"Invalid message body: {e}")
                 # Delete malformed message to avoid queue clogging
-                sqs.delete_message(QueueUrl=indexer_queue_url, ReceiptHandle=message['ReceiptHandle'])
-                return None, None
+                malformed_receipts.append(message['ReceiptHandle'])
+                continue
                 
-            receipt_handle = message['ReceiptHandle']
-            return data, receipt_handle
+            tasks.append((data, message['ReceiptHandle']))
+
+        delete_messages(malformed_receipts)
     except Exception as e:
         logger.error(f"Error receiving message from queue: {e}")
     
-    return None, None
+    return tasks
+
+def get_queue_depth():
+    """Return the indexer queue's ApproximateNumberOfMessages, or None if it cannot be read"""
+    try:
+        response = sqs.get_queue_attributes(
+            QueueUrl=indexer_queue_url,
+            AttributeNames=['ApproximateNumberOfMessages']
+        )
+        return int(response['Attributes']['ApproximateNumberOfMessages'])
+    except Exception as e:
+        logger.error(f"Error reading indexer queue depth: {e}")
+        return None
+
+def delete_messages(receipt_handles):
+    """Delete handled messages from the indexer queue, up to 10 per request; failed entries are retried once"""
+    for start in range(0, len(receipt_handles), SQS_BATCH_SIZE):
+        chunk = receipt_handles[start:start + SQS_BATCH_SIZE]
+        try:
+            response = sqs.delete_message_batch(
+                QueueUrl=indexer_queue_url,
+                Entries=[{'Id': str(i), 'ReceiptHandle': handle} for i, handle in enumerate(chunk)]
+            )
+        except ClientError as e:
+            # The messages reappear after their visibility timeout; reindexing them is idempotent
+            logger.error(f"Error deleting {len(chunk)} messages from indexer queue: {e}")
+            continue
+        
+        for failure in response.get('Failed', []):
+            try:
+                sqs.delete_message(QueueUrl=indexer_queue_url, ReceiptHandle=chunk[int(failure['Id'])])
+            except ClientError as e:
+                logger.warning(f"Could not delete message ({failure.get('Code')}), it will be redelivered: {e}")
+
+def content_type_from_mime(mime_type):
+    """Map a Content-Type header value to a document type, or None if it is missing or unknown"""
+    if not mime_type:
+        return None
+    mime_type = mime_type.split(';', 1)[0].strip().lower()
+    return MIME_CONTENT_TYPES.get(mime_type)
+
+def content_type_from_url(url):
+    """Guess the document type from the URL suffix"""
+    path = urlparse(url).path.lower()
+    if path.endswith('.pdf'):
+        return 'pdf'
+    elif path.endswith(('.doc', '.docx')):
+        return 'document'
+    return 'html'  # Default
 
 def process_content(task):
     """Process and enhance the content for better indexing"""
     # Extract existing fields
     url = task['url']
-    title = task.get('title', 'No Title')
-    content = task.get('content', '')
+    if 'html' in task:
+        # Crawlers send raw HTML and leave text extraction to the indexer
+        title, content = extract_page_text(task['html'])
+    else:
+        title = task.get('title', 'No Title')
+        content = task.get('content', '')
     timestamp = task.get('timestamp', time.time())
     
     # Generate additional metadata
@@ -310,12 +500,8 @@ def process_content(task):
     keywords = extract_keywords(content)
     summary = generate_summary(content)
     
-    # Determine content type (basic implementation)
-    content_type = 'html'  # Default
-    if url.endswith('.pdf'):
-        content_type = 'pdf'
-    elif url.endswith(('.doc', '.docx')):
-        content_type = 'document'
+    # Determine content type from the crawler's Content-Type header, falling back to the URL suffix
+    content_type = content_type_from_mime(task.get('content_type')) or content_type_from_url(url)
     
     # Create document with enhanced metadata
     document = {
@@ -332,96 +518,165 @@ def process_content(task):
     
     return document
 
-def index_document(idx, document, retry_count=0):
-    """Index a document with retry mechanism and PostgreSQL storage"""
+def process_content_safe(task):
+    """Run process_content in a worker process; returns None instead of raising for a bad payload"""
+    try:
+        return process_content(task)
+    except Exception as e:
+        logger.error(f"Error processing content for {task.get('url', 'unknown URL')}: {e}")
+        return None
+
+def index_documents(idx, documents, retry_count=0):
+    """Index a batch of documents under a single Whoosh commit, with retry mechanism and PostgreSQL storage.
+
+    Returns one success flag per document.
+    """
     writer = None
     try:
-        # First, update Whoosh index
-        writer = idx.writer()
-        writer.update_document(**document)
+        # First, update Whoosh index with one commit for the whole batch
+        procs = INDEX_WRITER_PROCS if len(documents) >= INDEX_PARALLEL_MIN_DOCS else 1
+        writer = idx.writer(limitmb=INDEX_WRITER_LIMITMB, procs=procs)
+        for document in documents:
+            writer.update_document(**document)
         writer.commit()
-        
-        # Then, store metadata in PostgreSQL
-        store_document_in_db(document)
-        
-        return True
+        writer = None  # Committed writers are closed and cannot be cancelled
     except Exception as e:
         if writer:
             writer.cancel()
         
-        logger.error(f"Error indexing document: {e}")
+        logger.error(f"Error indexing batch of {len(documents)} documents: {e}")
         
         # Implement exponential backoff for retries
         if retry_count < MAX_RETRIES:
             backoff_time = BACKOFF_TIME * (2 ** retry_count)
             logger.info(f"Retrying indexing in {backoff_time} seconds (attempt {retry_count+1}/{MAX_RETRIES})")
             time.sleep(backoff_time)
-            return index_document(idx, document, retry_count + 1)
+            return index_documents(idx, documents, retry_count + 1)
+        elif len(documents) > 1:
+            # Write the documents one at a time so a single bad document cannot fail the whole batch
+            logger.info(f"Falling back to indexing {len(documents)} documents individually")
+            return [index_documents(idx, [document], MAX_RETRIES)[0] for document in documents]
         else:
-            logger.error(f"Failed to index document after {MAX_RETRIES} attempts")
-            return False
+            logger.error(f"Failed to index documents after {MAX_RETRIES} attempts")
+            return [False]
+    
+    # Then, store metadata in PostgreSQL, retried on its own so the Whoosh commit is not repeated
+    return store_documents(documents)
+
+def store_documents(documents, retry_count=0):
+    """Store metadata for indexed documents in PostgreSQL, with retries and a per-document fallback.
+
+    Returns one success flag per document; a document whose metadata is not stored is redelivered
+    and re-indexed later, which is safe because update_document replaces by URL.
+    """
+    if store_documents_batch(documents):
+        return [True] * len(documents)
+    
+    if retry_count < MAX_RETRIES:
+        backoff_time = BACKOFF_TIME * (2 ** retry_count)
+        logger.info(f"Retrying PostgreSQL store in {backoff_time} seconds (attempt {retry_count+1}/{MAX_RETRIES})")
+        time.sleep(backoff_time)
+        return store_documents(documents, retry_count + 1)
+    elif len(documents) > 1:
+        # Store the documents one at a time so a single bad row cannot fail the whole batch
+        logger.info(f"Falling back to storing {len(documents)} documents individually")
+        return [store_documents([document], MAX_RETRIES)[0] for document in documents]
+    else:
+        logger.error(f"Failed to store {documents[0]['url']} in PostgreSQL after {MAX_RETRIES} attempts")
+        return [False]
 
-def store_document_in_db(document):
-    """Store document metadata in PostgreSQL database"""
+def optimize_index(idx):
+    """Merge the index's segments so searches read fewer files"""
+    segments_before = len(idx._segments())
+    idx.optimize()
+    logger.info(f"Optimized index: {segments_before} segments merged into {len(idx._segments())}")
+
+def store_documents_batch(documents):
+    """Store metadata for a batch of documents in PostgreSQL with one COPY and one upsert"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
-        # Convert datetime objects to strings for JSON serialization
-        doc_copy = document.copy()
-        if isinstance(doc_copy['timestamp'], datetime):
-            doc_copy['timestamp'] = doc_copy['timestamp'].isoformat()
-        if isinstance(doc_copy['last_updated'], datetime):
-            doc_copy['last_updated'] = doc_copy['last_updated'].isoformat()
-        
-        cursor.execute("""
-        INSERT INTO indexed_documents 
-        (url, domain, title, summary, content_type, keywords, timestamp, last_updated, index_status)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (url) DO UPDATE SET
-        domain = EXCLUDED.domain,
-        title = EXCLUDED.title,
-        summary = EXCLUDED.summary,
-        content_type = EXCLUDED.content_type,
-        keywords = EXCLUDED.keywords,
-        last_updated = EXCLUDED.last_updated,
-        index_status = EXCLUDED.index_status
-        """, (
-            document['url'],
-            document['domain'],
-            document['title'],
-            document['summary'],
-            document['content_type'],
-            document['keywords'],
-            document['timestamp'],
-            document['last_updated'],
-            'indexed'
-        ))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Serialize the batch as CSV; every field is quoted so empty strings stay distinct from NULL
+            buffer = io.StringIO()
+            csv_writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+            for document in documents:
+                csv_writer.writerow((
+                    document['url'],
+                    document['domain'],
+                    document['title'],
+                    document['summary'],
+                    document['content_type'],
+                    document['keywords'],
+                    document['timestamp'].isoformat(),
+                    document['last_updated'].isoformat(),
+                    'indexed'
+                ))
+            buffer.seek(0)
+            
+            # Stage the rows with COPY, then merge them into indexed_documents in a single statement
+            cursor.execute("""
+            CREATE TEMP TABLE staging_documents
+            (LIKE indexed_documents INCLUDING DEFAULTS) ON COMMIT DROP
+            """)
+            cursor.copy_expert("""
+            COPY staging_documents
+            (url, domain, title, summary, content_type, keywords, timestamp, last_updated, index_status)
+            FROM STDIN WITH (FORMAT csv)
+            """, buffer)
+            
+            cursor.execute(MERGE_STAGED_DOCUMENTS_SQL)
+            
+            conn.commit()
+            cursor.close()
         return True
     except Exception as e:
-        logger.error(f"Error storing document in database: {e}")
+        logger.error(f"Error storing {len(documents)} documents in database: {e}")
         return False
 
 def send_result(result):
     """Send indexing result to the indexer result queue"""
     try:
-        # Add message deduplication ID to ensure exactly-once delivery
-        deduplication_id = hashlib.md5(json.dumps(result).encode()).hexdigest()
+        # orjson serializes datetime values natively; anything else falls back to str
+        body = orjson.dumps(result, default=str)
+        
+        send_kwargs = {}
+        if indexer_result_queue_url.endswith('.fifo'):
+            # Add message deduplication ID to ensure exactly-once delivery
+            send_kwargs['MessageGroupId'] = 'indexing'
+            send_kwargs['MessageDeduplicationId'] = hashlib.blake2b(body, digest_size=16).hexdigest()
         
         sqs.send_message(
             QueueUrl=indexer_result_queue_url,
-            MessageBody=json.dumps(result),
-            MessageGroupId='indexing',
-            MessageDeduplicationId=deduplication_id
+            MessageBody=body.decode(),
+            **send_kwargs
         )
         logger.debug(f"Sent result for {result.get('indexed_url', 'unknown URL')}")
     except Exception as e:
         logger.error(f"Error sending result to queue: {e}")
 
+def get_searcher():
+    """Return the shared (searcher, parser), refreshing the searcher when new segments have been committed"""
+    global _searcher, _search_parser
+    if _searcher is None:
+        idx = open_dir(INDEX_DIR)
+        
+        # Create a parser for multiple fields with different weights
+        fields = ["title", "content", "keywords"]
+        field_boosts = {"title": 2.0, "keywords": 1.5, "content": 1.0}
+        
+        _search_parser = MultifieldParser(fields, schema=idx.schema, group=OrGroup)
+        _search_parser.add_plugin(FuzzyTermPlugin())  # Allow fuzzy matching
+        _search_parser.add_plugin(PhrasePlugin())     # Support phrase queries
+        
+        _searcher = idx.searcher()
+    else:
+        fresh_searcher = _searcher.refresh()
+        if fresh_searcher is not _searcher:
+            _searcher.close()
+            _searcher = fresh_searcher
+    return _searcher, _search_parser
+
 def search_by_word(query, page=1, results_per_page=10, domain_filter=None, content_type_filter=None):
     """
     Search for documents matching the query with pagination and filtering options
@@ -433,65 +688,55 @@ def search_by_word(query, page=1, results_per_page=10, domain_filter=None, conte
             logger.error("Search index directory does not exist")
             return {"error": "Search index not available"}, 0
         
-        idx = open_dir(INDEX_DIR)
-        
-        # Create a parser for multiple fields with different weights
-        fields = ["title", "content", "keywords"]
-        field_boosts = {"title": 2.0, "keywords": 1.5, "content": 1.0}
-        
-        parser = MultifieldParser(fields, schema=idx.schema, group=OrGroup)
-        parser.add_plugin(FuzzyTermPlugin())  # Allow fuzzy matching
-        parser.add_plugin(PhrasePlugin())     # Support phrase queries
+        searcher, parser = get_searcher()
         
         # Parse the query
         parsed_query = parser.parse(query)
         
-        # Prepare search parameters
+        # Apply domain and content type filters inside Whoosh instead of on materialized hits
+        filter_terms = []
+        if domain_filter:
+            filter_terms.append(Term("domain", domain_filter))
+        if content_type_filter:
+            filter_terms.append(Term("content_type", content_type_filter))
+        
+        # Only score as many hits as the requested page needs; results are ordered by relevance score
+        start_idx = (page - 1) * results_per_page
+        end_idx = start_idx + results_per_page
         search_kwargs = {
-            "limit": None,  # Get all results for filtering
+            "limit": end_idx,
             "terms": True,  # Include matched terms in results
-            "sortedby": "score",  # Sort by relevance score
+            "filter": And(filter_terms) if filter_terms else None,
         }
         
-        # Perform the search
-        with idx.searcher() as searcher:
-            results = searcher.search(parsed_query, **search_kwargs)
-            
-            # Apply post-search filters
-            filtered_results = []
-            for hit in results:
-                # Apply domain filter if specified
-                if domain_filter and hit['domain'] != domain_filter:
-                    continue
-                
-                # Apply content type filter if specified
-                if content_type_filter and hit['content_type'] != content_type_filter:
-                    continue
-                
-                # Add to filtered results
-                filtered_results.append({
-                    "url": hit["url"],
-                    "title": hit["title"],
-                    "summary": hit["summary"],
-                    "domain": hit["domain"],
-                    "content_type": hit["content_type"],
-                    "score": hit.score,
-                    "matched_terms": list(hit.matched_terms()),
-                    "keywords": hit["keywords"].split(",") if hit["keywords"] else [],
-                    "timestamp": hit["timestamp"].isoformat() if hit["timestamp"] else None,
-                    "last_updated": hit["last_updated"].isoformat() if hit["last_updated"] else None
-                })
-            
-            # Calculate pagination
-            total_results = len(filtered_results)
-            start_idx = (page - 1) * results_per_page
-            end_idx = start_idx + results_per_page
-            paginated_results = filtered_results[start_idx:end_idx] if filtered_results else []
-            
-            # Record search statistics in PostgreSQL
-            record_search_statistics(query)
-            
-            return paginated_results, total_results
+        # Perform the search on the shared searcher
+        results = searcher.search(parsed_query, **search_kwargs)
+        
+        # Calculate pagination; len(results) ignores the filter, so count filtered hits separately
+        if filter_terms:
+            total_results = searcher.search(parsed_query, limit=None, filter=search_kwargs["filter"],
+                                            scored=False).scored_length()
+        else:
+            total_results = len(results)
+        paginated_results = []
+        for hit in results[start_idx:end_idx]:
+            paginated_results.append({
+                "url": hit["url"],
+                "title": hit["title"],
+                "summary": hit["summary"],
+                "domain": hit["domain"],
+                "content_type": hit["content_type"],
+                "score": hit.score,
+                "matched_terms": list(hit.matched_terms()),
+                "keywords": hit["keywords"].split(",") if hit["keywords"] else [],
+                "timestamp": hit["timestamp"].isoformat() if hit["timestamp"] else None,
+                "last_updated": hit["last_updated"].isoformat() if hit["last_updated"] else None
+            })
+        
+        # Record search statistics in PostgreSQL
+        record_search_statistics(query)
+        
+        return paginated_results, total_results
     except Exception as e:
         logger.error(f"Search error: {e}")
         return {"error": f"Search failed: {str(e)}"}, 0
@@ -499,91 +744,94 @@ def search_by_word(query, page=1, results_per_page=10, domain_filter=None, conte
 def record_search_statistics(query):
     """Record search terms and statistics in PostgreSQL"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
-        # Normalize query by converting to lowercase and removing extra spaces
-        normalized_query = " ".join(query.lower().split())
-        
-        # Insert or update search statistics
-        cursor.execute("""
-        INSERT INTO search_statistics (search_term, search_count, last_searched)
-        VALUES (%s, 1, %s)
-        ON CONFLICT (search_term) DO UPDATE SET
-        search_count = search_statistics.search_count + 1,
-        last_searched = %s
-        """, (normalized_query, datetime.now(), datetime.now()))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Normalize query by converting to lowercase and removing extra spaces
+            normalized_query = " ".join(query.lower().split())
+            
+            # Insert or update search statistics
+            cursor.execute(UPSERT_SEARCH_STATISTICS_SQL, (normalized_query, datetime.now()))
+            
+            conn.commit()
+            cursor.close()
     except Exception as e:
         logger.error(f"Error recording search statistics: {e}")
 
+def fetch_columns_and_rows(cursor):
+    """Return a cursor's result as column names plus plain row tuples instead of one dict per row"""
+    return {
+        "columns": [column.name for column in cursor.description],
+        "rows": cursor.fetchall()
+    }
+
 def get_popular_searches(limit=10):
     """Get the most popular search terms from PostgreSQL"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor(cursor_factory=DictCursor)
-        
-        cursor.execute("""
-        SELECT search_term, search_count, last_searched
-        FROM search_statistics
-        ORDER BY search_count DESC
-        LIMIT %s
-        """, (limit,))
-        
-        popular_searches = [dict(row) for row in cursor]
-        
-        cursor.close()
-        conn.close()
-        
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+            SELECT search_term, search_count, last_searched
+            FROM search_statistics
+            ORDER BY search_count DESC
+            LIMIT %s
+            """, (limit,))
+            
+            popular_searches = fetch_columns_and_rows(cursor)
+            
+            cursor.close()
+            
         return popular_searches
     except Exception as e:
         logger.error(f"Error retrieving popular searches: {e}")
-        return []
+        return {"columns": [], "rows": []}
 
 def get_indexing_stats():
     """Get indexing statistics from PostgreSQL"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor(cursor_factory=DictCursor)
-        
-        # Get total count
-        cursor.execute("SELECT COUNT(*) as total FROM indexed_documents")
-        total = cursor.fetchone()['total']
-        
-        # Get counts by content type
-        cursor.execute("""
-        SELECT content_type, COUNT(*) as count
-        FROM indexed_documents
-        GROUP BY content_type
-        ORDER BY count DESC
-        """)
-        by_content_type = [dict(row) for row in cursor]
-        
-        # Get counts by domain (top 10)
-        cursor.execute("""
-        SELECT domain, COUNT(*) as count
-        FROM indexed_documents
-        GROUP BY domain
-        ORDER BY count DESC
-        LIMIT 10
-        """)
-        by_domain = [dict(row) for row in cursor]
-        
-        # Get recent additions
-        cursor.execute("""
-        SELECT url, title, domain, last_updated
-        FROM indexed_documents
-        ORDER BY last_updated DESC
-        LIMIT 10
-        """)
-        recent = [dict(row) for row in cursor]
-        
-        cursor.close()
-        conn.close()
-        
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Get the planner's row estimate; it is -1 until the table has been vacuumed or analyzed
+            cursor.execute("""
+            SELECT reltuples::bigint FROM pg_class WHERE oid = 'indexed_documents'::regclass
+            """)
+            total = cursor.fetchone()[0]
+            if total < 0:
+                cursor.execute("SELECT COUNT(*) FROM indexed_documents")
+                total = cursor.fetchone()[0]
+            
+            # Get counts by content type
+            cursor.execute("""
+            SELECT content_type, COUNT(*) as count
+            FROM indexed_documents
+            GROUP BY content_type
+            ORDER BY count DESC
+            """)
+            by_content_type = fetch_columns_and_rows(cursor)
+            
+            # Get counts by domain (top 10)
+            cursor.execute("""
+            SELECT domain, COUNT(*) as count
+            FROM indexed_documents
+            GROUP BY domain
+            ORDER BY count DESC
+            LIMIT 10
+            """)
+            by_domain = fetch_columns_and_rows(cursor)
+            
+            # Get recent additions
+            cursor.execute("""
+            SELECT url, title, domain, last_updated
+            FROM indexed_documents
+            ORDER BY last_updated DESC
+            LIMIT 10
+            """)
+            recent = fetch_columns_and_rows(cursor)
+            
+            cursor.close()
+            
         return {
             "total_documents": total,
             "by_content_type": by_content_type,
@@ -655,74 +903,126 @@ def indexer_process():
     indexed_count = 0
     failed_count = 0
     idle_counter = 0
+    idle_since = None  # time.monotonic() of the first empty poll in the current idle period
+    empty_queue_checks = 0
+    pending = []  # (task, document, receipt_handle) awaiting the next batched commit
+    docs_since_optimize = 0
+    last_flush = time.monotonic()
+
+    # HTML parsing, keyword extraction and summaries are CPU-bound; the Whoosh writer stays in this process
+    content_pool = Pool(processes=CONTENT_WORKERS)
 
     logger.info("Starting indexer process")
 
     while True:
-        task, receipt_handle = receive_task()
-        
-        # Check if this is an API request instead of indexing task
-        if task and "type" in task and task["type"].startswith("api_"):
-            logger.info(f"Processing API request: {task['type']}")
-            
-            # Handle the API request
-            result = handle_api_request(task)
-            
-            # Send the result back
-            send_result(result)
-            
-            # Delete the message
-            sqs.delete_message(QueueUrl=indexer_queue_url, ReceiptHandle=receipt_handle)
+        tasks = receive_tasks()
+        handled_receipts = []
+        index_tasks = []
+
+        for task, receipt_handle in tasks:
+            try:
+                # Check if this is an API request instead of indexing task
+                if "type" in task and task["type"].startswith("api_"):
+                    logger.info(f"Processing API request: {task['type']}")
+                    
+                    # Handle the API request
+                    result = handle_api_request(task)
+                    
+                    # Send the result back
+                    send_result(result)
+                    handled_receipts.append(receipt_handle)
+                    continue
+
+                # Regular indexing task handling
+                logger.info(f"Processing URL: {task['url']}")
+                index_tasks.append((task, receipt_handle))
+            except Exception as e:
+                # One bad payload must not take down the rest of the batch; drop it from the queue
+                logger.error(f"Error processing message: {e}")
+                handled_receipts.append(receipt_handle)
+
+        # Process and enhance the batch's content in parallel, then queue it for the next commit
+        documents = content_pool.map(process_content_safe, [task for task, _ in index_tasks])
+        for (task, receipt_handle), document in zip(index_tasks, documents):
+            if document is None:
+                handled_receipts.append(receipt_handle)
+            else:
+                pending.append((task, document, receipt_handle))
+
+        delete_messages(handled_receipts)
+
+        # Commit when the batch is full, the flush interval has elapsed or the queue went quiet;
+        # on a FIFO queue, always, since pending messages would block the next receive
+        if pending and (INDEXER_QUEUE_IS_FIFO or len(pending) >= INDEX_BATCH_SIZE or not tasks
+                        or time.monotonic() - last_flush >= INDEX_FLUSH_INTERVAL):
+            results = index_documents(idx, [document for _, document, _ in pending])
             
-            continue
-        
-        # Regular indexing task handling
-        if not task:
+            # Handle the result
+            for (task, _, _), success in zip(pending, results):
+                if success:
+                    indexed_count += 1
+                    logger.info(f"Successfully indexed {task['url']} ({indexed_count} total)")
+                    
+                    # Send success result
+                    send_result({
+                        "status": "success",
+                        "indexed_url": task['url'],
+                        "indexed_count": indexed_count,
+                        "timestamp": datetime.now().isoformat()
+                    })
+                else:
+                    failed_count += 1
+                    logger.error(f"Failed to index {task['url']} ({failed_count} failures)")
+                    
+                    # Send failure result
+                    send_result({
+                        "status": "failure",
+                        "failed_url": task['url'],
+                        "error": "Indexing failed",
+                        "failed_count": failed_count,
+                        "timestamp": datetime.now().isoformat()
+                    })
+
+            # Only committed documents are removed from the queue
+            delete_messages([receipt_handle for (_, _, receipt_handle), success in zip(pending, results) if success])
+            docs_since_optimize += sum(results)
+            pending = []
+            last_flush = time.monotonic()
+
+        # Merge segments after a bulk of commits
+        if docs_since_optimize >= INDEX_OPTIMIZE_INTERVAL:
+            optimize_index(idx)
+            docs_since_optimize = 0
+
+        if not tasks:
             idle_counter += 1
-            logger.info(f"No indexing tasks. Idle count: {idle_counter}")
-            if idle_counter >= MAX_IDLE_COUNT:
+            if idle_since is None:
+                idle_since = time.monotonic()
+            idle_seconds = time.monotonic() - idle_since
+            logger.info(f"No indexing tasks. Idle count: {idle_counter}, idle for {idle_seconds:.0f} seconds")
+            if idle_seconds >= MAX_IDLE_SECONDS:
                 logger.info("No more indexing tasks. Shutting down indexer.")
                 break
-            time.sleep(BACKOFF_TIME)
+
+            # Every few empty polls, ask SQS whether the queue is really empty and back off further if so
+            if idle_counter % QUEUE_DEPTH_CHECK_INTERVAL == 0:
+                if get_queue_depth() == 0:
+                    empty_queue_checks += 1
+                    # The queue is really empty: merge what was indexed since the last optimize, once per idle period
+                    if docs_since_optimize:
+                        optimize_index(idx)
+                        docs_since_optimize = 0
+                else:
+                    empty_queue_checks = 0
+            time.sleep(min(MAX_BACKOFF_TIME, BACKOFF_TIME * 2 ** empty_queue_checks))
             continue
 
         idle_counter = 0
-        logger.info(f"Processing URL: {task['url']}")
-
-        # Process and enhance content
-        document = process_content(task)
-        
-        # Index the document
-        success = index_document(idx, document)
-        
-        # Handle the result
-        if success:
-            # Delete the message from queue
-            sqs.delete_message(QueueUrl=indexer_queue_url, ReceiptHandle=receipt_handle)
-            indexed_count += 1
-            logger.info(f"Successfully indexed {task['url']} ({indexed_count} total)")
-            
-            # Send success result
-            send_result({
-                "status": "success",
-                "indexed_url": task['url'],
-                "indexed_count": indexed_count,
-                "timestamp": datetime.now().isoformat()
-            })
-        else:
-            failed_count += 1
-            logger.error(f"Failed to index {task['url']} ({failed_count} failures)")
-            
-            # Send failure result
-            send_result({
-                "status": "failure",
-                "failed_url": task['url'],
-                "error": "Indexing failed",
-                "failed_count": failed_count,
-                "timestamp": datetime.now().isoformat()
-            })
+        idle_since = None
+        empty_queue_checks = 0
 
-        time.sleep(PROCESSING_DELAY)
+    content_pool.close()
+    content_pool.join()
 
     logger.info(f"Indexer process completed. Total indexed: {indexed_count}, Failed: {failed_count}")
 
@@ -1,16 +1,24 @@
 import time
 import logging
 import boto3
-import json
-import hashlib
+import orjson
 import botocore.exceptions
-import argparse
+from botocore.config import Config
 import sys
 import re
+import heapq
+import itertools
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter
 from urllib.parse import urlparse
+from pybloom_live import ScalableBloomFilter
+from url_canonical import canonicalize_url, generate_url_hash
 
 # Parse command line arguments
 def parse_arguments():
+    # Imported here so that processes importing master_process (e.g. main.py) skip it
+    import argparse
     parser = argparse.ArgumentParser(description='Master node for web crawler')
     parser.add_argument('--urls', nargs='+', help='Seed URLs to crawl')
     parser.add_argument('--depth', type=int, default=3, help='Maximum crawl depth per domain (default: 3)')
@@ -18,112 +26,185 @@ def parse_arguments():
     return parser.parse_args()
 
 # AWS SQS Client Configuration
-sqs = boto3.client('sqs', region_name='us-east-1')
+sqs = boto3.client('sqs', region_name='us-east-1', config=Config(
+    max_pool_connections=50,
+    tcp_keepalive=True,
+    retries={'mode': 'adaptive', 'max_attempts': 5}
+))
 crawler_queue_url = 'https://sqs.us-east-1.amazonaws.com/969510159350/crawler-queue.fifo'
 crawler_result_queue_url = 'https://sqs.us-east-1.amazonaws.com/969510159350/crawler-result-queue.fifo'
 indexer_queue_url = 'https://sqs.us-east-1.amazonaws.com/969510159350/indexer-queue.fifo'
 indexer_result_queue_url = 'https://sqs.us-east-1.amazonaws.com/969510159350/indexer-result-queue.fifo'
 
+# Threads polling the crawler and indexer result queues concurrently; boto3 clients are thread-safe.
+# One receiver per queue: both are FIFO queues with a single message group, which SQS serves in order,
+# so extra receivers would mostly wait on each other
+_result_pollers = ThreadPoolExecutor(max_workers=2)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - Master - %(levelname)s - %(message)s')
+logger = logging.getLogger("master")
+
+# Track visited URLs to avoid reprocessing; a Bloom filter keeps memory bounded at the cost of rare false positives
+visited_urls = ScalableBloomFilter(initial_capacity=1_000_000, error_rate=0.001)
 
-# Track visited URLs to avoid reprocessing
-visited_urls = set()
+# Tasks waiting to be sent in the next SendMessageBatch request (SQS allows at most 10 entries)
+SQS_BATCH_SIZE = 10
+_pending_batch = []
 
 # Domain politeness tracker (per-domain crawl delay enforcement)
-domain_last_access = {}
+domain_last_access = {}  # Canonical host -> time.monotonic() at which its latest task is sent
 POLITENESS_DELAY = 5  # seconds
 
-# Get domain from URL
+# Tasks held back until their domain's politeness delay has passed: (send_at, sequence, url, host, depth_limit, restricted_patterns)
+_scheduled_tasks = []
+_task_sequence = itertools.count()
+
+# Longest SQS long poll; shorter while a scheduled task is about to become due
+RESULT_POLL_WAIT = 20
+
+# Shut down after this many seconds without results or scheduled tasks
+IDLE_SHUTDOWN_SECONDS = 150
+
+# Crawl result fields the crawler also sends as message attributes; results carrying them are read
+# from the attributes, without decoding the body
+CRAWL_RESULT_ATTRIBUTES = ['url', 'url_hash', 'status', 'depth', 'seed_domain', 'status_code', 'content_length']
+
 def get_domain(url):
-    parsed = urlparse(url)
-    return parsed.netloc
+    """Host as written in the URL, as the crawler reads it for its same-domain check"""
+    return urlparse(url).netloc
 
-# Task deduplication filter using hashing
-def hash_url(url):
-    return hashlib.md5(url.encode('utf-8')).hexdigest()
+def filter_new_urls(urls):
+    """Drop URLs whose canonical form was already visited or repeated, in one pass; returns (url, host) pairs of the rest.
 
-def send_task_to_queue(url, depth_limit, restricted_patterns):
-    url_hash = hash_url(url)
-    if url_hash in visited_urls:
-        logging.debug(f"Skipping already visited URL: {url}")
-        return
+    The URLs are returned as given, so the crawler fetches exactly what was submitted.
+    """
+    new_urls = []
+    for url in urls:
+        url = url.strip()
+        canonical_url, host = canonicalize_url(url)
+        if canonical_url in visited_urls:
+            logger.debug("Skipping already visited URL: %s", url)
+            continue
+        visited_urls.add(canonical_url)
+        new_urls.append((url, host))
+    return new_urls
 
-    visited_urls.add(url_hash)
+def send_task_to_queue(url, host, depth_limit, restricted_patterns):
+    url_hash = generate_url_hash(url)  # Variants of one URL share a deduplication ID, as in the crawler
     seed_domain = get_domain(url)
-    message = json.dumps({
+    message = orjson.dumps({
         'url': url,
         'depth': 0,  # Start at depth 0 for seed URLs
         'seed_domain': seed_domain,
         'depth_limit': depth_limit,
         'restricted_patterns': restricted_patterns  # Add restricted patterns to the message
+    }).decode()
+
+    _pending_batch.append({
+        'MessageBody': message,
+        'MessageGroupId': host or 'default',  # Per-host group: ordered within a host, parallel across hosts
+        'MessageDeduplicationId': url_hash
     })
+    logger.info("Queued URL for crawler queue: %s (depth_limit: %s, domain: %s)", url, depth_limit, seed_domain)
+    if len(_pending_batch) >= SQS_BATCH_SIZE:
+        flush_task_batch()
 
-    try:
-        sqs.send_message(
-            QueueUrl=crawler_queue_url,
-            MessageBody=message,
-            MessageGroupId='crawler_tasks',
-            MessageDeduplicationId=url_hash
-        )
-        logging.info(f"Sent URL to crawler queue: {url} (depth_limit: {depth_limit}, domain: {seed_domain})")
-    except botocore.exceptions.ClientError as e:
-        logging.error(f"Error sending message to SQS: {e}")
+def schedule_task(url, host, depth_limit, restricted_patterns):
+    """Hold a task until its canonical host has waited POLITENESS_DELAY since the host's previous task"""
+    now = time.monotonic()
+    send_at = max(now, domain_last_access.get(host, now - POLITENESS_DELAY) + POLITENESS_DELAY)
+    domain_last_access[host] = send_at
+    heapq.heappush(_scheduled_tasks, (send_at, next(_task_sequence), url, host, depth_limit, restricted_patterns))
+
+def release_due_tasks():
+    """Send every scheduled task that is due; returns seconds until the next one is due, or None if none are left"""
+    now = time.monotonic()
+    while _scheduled_tasks and _scheduled_tasks[0][0] <= now:
+        _, _, url, host, depth_limit, restricted_patterns = heapq.heappop(_scheduled_tasks)
+        send_task_to_queue(url, host, depth_limit, restricted_patterns)
+    flush_task_batch()
+    if _scheduled_tasks:
+        return _scheduled_tasks[0][0] - now
+    return None
 
-def receive_crawler_results():
+def flush_task_batch():
+    """Send pending tasks in one SendMessageBatch request; entries failing on the SQS side are retried individually"""
+    if not _pending_batch:
+        return
+
+    entries = [dict(entry, Id=str(i)) for i, entry in enumerate(_pending_batch)]
+    _pending_batch.clear()
     try:
-        response = sqs.receive_message(
-            QueueUrl=crawler_result_queue_url,
-            MaxNumberOfMessages=10,
-            WaitTimeSeconds=5,
-            AttributeNames=['All'],
-            MessageAttributeNames=['All']
-        )
+        response = sqs.send_message_batch(QueueUrl=crawler_queue_url, Entries=entries)
     except botocore.exceptions.ClientError as e:
-        logging.error(f"Error receiving message from crawler result queue: {e}")
-        return []
+        logger.error("Error sending message batch to SQS: %s", e)
+        return
 
-    results = []
-    if 'Messages' in response:
-        for message in response['Messages']:
-            try:
-                result = json.loads(message['Body'])
-                results.append(result)
-                sqs.delete_message(
-                    QueueUrl=crawler_result_queue_url,
-                    ReceiptHandle=message['ReceiptHandle']
-                )
-            except Exception as e:
-                logging.error(f"Error processing crawler result message: {e}")
-    return results
+    failed = response.get('Failed', [])
+    for failure in failed:
+        entry = entries[int(failure['Id'])]
+        del entry['Id']
+        if failure.get('SenderFault'):
+            logger.error("SQS rejected task %s: %s", entry['MessageDeduplicationId'], failure.get('Message'))
+            continue
+        # Retry the entry on its own; if that fails too it waits for the next flush
+        try:
+            sqs.send_message(QueueUrl=crawler_queue_url, **entry)
+        except botocore.exceptions.ClientError as e:
+            logger.warning("Retry of task %s failed, keeping it for the next batch: %s", entry['MessageDeduplicationId'], e)
+            _pending_batch.append(entry)
+    logger.info("Sent %d tasks to crawler queue", len(entries) - len(failed))
 
-def receive_indexer_results():
+def result_from_attributes(attributes):
+    """Build a result dict from a message's attributes; Number attributes become ints"""
+    return {
+        name: int(value['StringValue']) if value['DataType'] == 'Number' else value['StringValue']
+        for name, value in attributes.items()
+    }
+
+def receive_results(queue_url, queue_name, wait_seconds=RESULT_POLL_WAIT, attribute_names=()):
     try:
         response = sqs.receive_message(
-            QueueUrl=indexer_result_queue_url,
+            QueueUrl=queue_url,
             MaxNumberOfMessages=10,
-            WaitTimeSeconds=5,
-            AttributeNames=['All'],
-            MessageAttributeNames=['All']
+            WaitTimeSeconds=wait_seconds,
+            MessageAttributeNames=list(attribute_names)
         )
     except botocore.exceptions.ClientError as e:
-        logging.error(f"Error receiving message from indexer result queue: {e}")
+        logger.error("Error receiving message from %s result queue: %s", queue_name, e)
         return []
 
     results = []
-    if 'Messages' in response:
-        for message in response['Messages']:
-            try:
-                result = json.loads(message['Body'])
-                results.append(result)
-                sqs.delete_message(
-                    QueueUrl=indexer_result_queue_url,
-                    ReceiptHandle=message['ReceiptHandle']
-                )
-            except Exception as e:
-                logging.error(f"Error processing indexer result message: {e}")
+    delete_entries = []
+    for message in response.get('Messages', []):
+        try:
+            attributes = message.get('MessageAttributes')
+            if attributes and 'status' in attributes:
+                result = result_from_attributes(attributes)
+            else:
+                result = orjson.loads(message['Body'])
+        except Exception as e:
+            # Unparseable messages are left on the queue
+            logger.error("Error processing %s result message: %s", queue_name, e)
+            continue
+        results.append(result)
+        delete_entries.append({'Id': str(len(delete_entries)), 'ReceiptHandle': message['ReceiptHandle']})
+
+    # Delete every parsed message with a single request
+    if delete_entries:
+        try:
+            sqs.delete_message_batch(QueueUrl=queue_url, Entries=delete_entries)
+        except botocore.exceptions.ClientError as e:
+            logger.error("Error deleting messages from %s result queue: %s", queue_name, e)
     return results
 
+def receive_crawler_results(wait_seconds=RESULT_POLL_WAIT):
+    return receive_results(crawler_result_queue_url, "crawler", wait_seconds, CRAWL_RESULT_ATTRIBUTES)
+
+def receive_indexer_results(wait_seconds=RESULT_POLL_WAIT):
+    return receive_results(indexer_result_queue_url, "indexer", wait_seconds)
+
 def prepare_restricted_patterns(restricted_urls):
     patterns = []
     if restricted_urls:
@@ -140,15 +221,53 @@ def prepare_restricted_patterns(restricted_urls):
                     patterns.append(f"https?://{re.escape(url)}.*")
                     continue
             
-            # Replace * with .* but escape other regex special chars
-            pattern = url.replace('*', '__WILDCARD__')
-            pattern = re.escape(pattern)
-            pattern = pattern.replace('__WILDCARD__', '.*')
-            patterns.append(pattern)
+            # Escape the text between * wildcards and join the pieces with .*
+            patterns.append('.*'.join(map(re.escape, url.split('*'))))
     return patterns
 
+def compile_restricted_patterns(restricted_patterns):
+    """Combine restricted patterns into one compiled regex, or None when nothing is restricted"""
+    if not restricted_patterns:
+        return None
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in restricted_patterns))
+
+def record_crawl_results(crawler_stats, results):
+    """Add a batch of crawl results, from the crawlers or for seeds rejected here, to crawler_stats"""
+    # Tally the batch per (depth, domain, outcome) first, then update the stats once per group
+    batch_counts = Counter()
+    for result in results:
+        depth = result.get("depth", 0)
+        domain = result.get("seed_domain", "unknown")
+        status = result.get("status")
+        if status == "restricted":
+            outcome = "restricted"
+            logger.info("Restricted URL skipped: %s", result.get('url', 'N/A'))
+        elif status == "skipped":
+            outcome = "skipped"
+        elif status == "success":
+            outcome = "success"
+        else:
+            outcome = "errors"
+        batch_counts[(depth, domain, outcome)] += 1
+        
+        logger.info("Crawler result: %s - Status: %s - Depth: %s", result.get('url', 'N/A'), result.get('status', 'unknown'), depth)
+
+    crawler_stats["urls_processed"] += len(results)
+    for (depth, domain, outcome), count in batch_counts.items():
+        # Track by depth and by domain
+        depth_stats = crawler_stats["by_depth"].setdefault(depth, {"count": 0, "success": 0, "errors": 0})
+        domain_stats = crawler_stats["by_domain"].setdefault(domain, {"count": 0, "success": 0, "errors": 0})
+        depth_stats["count"] += count
+        domain_stats["count"] += count
+        
+        # Restricted and skipped URLs only count towards the total
+        crawler_stats[outcome] += count
+        if outcome in ("success", "errors"):
+            depth_stats[outcome] += count
+            domain_stats[outcome] += count
+
 def master_process(seed_urls=None, depth_limit=3, restricted_urls=None):
-    logging.info("Master node started.")
+    logger.info("Master node started.")
 
     # Use provided seed URLs or default to a fallback
     if not seed_urls:
@@ -157,98 +276,93 @@ def master_process(seed_urls=None, depth_limit=3, restricted_urls=None):
     # Process restricted URLs into patterns
     restricted_patterns = prepare_restricted_patterns(restricted_urls)
     if restricted_patterns:
-        logging.info(f"Restricted URL patterns: {restricted_patterns}")
+        logger.info("Restricted URL patterns: %s", restricted_patterns)
     
-    logging.info(f"Starting crawl with seed URLs: {seed_urls}")
-    logging.info(f"Maximum crawl depth per domain: {depth_limit}")
-
-    # Send all seed URLs to the crawler queue
-    for url in seed_urls:
-        send_task_to_queue(url, depth_limit, restricted_patterns)
+    logger.info("Starting crawl with seed URLs: %s", seed_urls)
+    logger.info("Maximum crawl depth per domain: %s", depth_limit)
 
-    # Monitor both result queues for updates
-    idle_counter = 0
     crawler_stats = {
         "urls_processed": 0,
         "success": 0,
         "errors": 0,
         "restricted": 0,  # Count of restricted URLs encountered
+        "skipped": 0,  # Count of non-HTML pages the crawler did not download
         "by_depth": {}, # Track stats by depth
         "by_domain": {}  # Track stats by domain
     }
+
+    # Schedule all seed URLs; the first one per domain is sent right away.
+    # Restricted seeds are dropped here rather than round-tripping through the crawler.
+    restricted_regex = compile_restricted_patterns(restricted_patterns)
+    restricted_seeds = []
+    for url, host in filter_new_urls(seed_urls):
+        if restricted_regex and restricted_regex.match(url):
+            # Counted exactly like a restricted result reported by a crawler
+            restricted_seeds.append({"url": url, "status": "restricted", "depth": 0, "seed_domain": get_domain(url)})
+            continue
+        schedule_task(url, host, depth_limit, restricted_patterns)
+    record_crawl_results(crawler_stats, restricted_seeds)
+    release_due_tasks()
+
+    # Monitor both result queues for updates
+    last_activity = time.monotonic()
     indexer_stats = {
         "pages_indexed": 0,
         "keywords_indexed": 0
     }
     
     while True:
-        # Process crawler results
-        crawler_results = receive_crawler_results()
-        if crawler_results:
-            idle_counter = 0
-            for result in crawler_results:
-                crawler_stats["urls_processed"] += 1
-                
-                # Track by depth
-                depth = result.get("depth", 0)
-                if depth not in crawler_stats["by_depth"]:
-                    crawler_stats["by_depth"][depth] = {"count": 0, "success": 0, "errors": 0}
-                crawler_stats["by_depth"][depth]["count"] += 1
-                
-                # Track by domain
-                domain = result.get("seed_domain", "unknown")
-                if domain not in crawler_stats["by_domain"]:
-                    crawler_stats["by_domain"][domain] = {"count": 0, "success": 0, "errors": 0}
-                crawler_stats["by_domain"][domain]["count"] += 1
-                
-                # Track restricted URLs
-                if result.get("status") == "restricted":
-                    crawler_stats["restricted"] += 1
-                    logging.info(f"Restricted URL skipped: {result.get('url', 'N/A')}")
-                elif result.get("status") == "success":
-                    crawler_stats["success"] += 1
-                    crawler_stats["by_depth"][depth]["success"] += 1
-                    crawler_stats["by_domain"][domain]["success"] += 1
-                else:
-                    crawler_stats["errors"] += 1
-                    crawler_stats["by_depth"][depth]["errors"] += 1
-                    crawler_stats["by_domain"][domain]["errors"] += 1
-                
-                logging.info(f"Crawler result: {result.get('url', 'N/A')} - Status: {result.get('status', 'unknown')} - Depth: {depth}")
+        # Send tasks whose politeness delay has passed, and retry any SQS failed to accept
+        next_due = release_due_tasks()
+        wait_seconds = RESULT_POLL_WAIT if next_due is None else min(RESULT_POLL_WAIT, math.ceil(next_due))
+
+        # Long-poll both result queues at the same time and handle each batch as soon as its poll returns
+        polls = {
+            _result_pollers.submit(receive_crawler_results, wait_seconds): "crawler",
+            _result_pollers.submit(receive_indexer_results, wait_seconds): "indexer"
+        }
+        received_results = False
+        for future in as_completed(polls):
+            results = future.result()
+            if not results:
+                continue
+            received_results = True
+            last_activity = time.monotonic()
+
+            # Process crawler results
+            if polls[future] == "crawler":
+                record_crawl_results(crawler_stats, results)
                 
-                # Only show detailed stats periodically to avoid log flooding
-                if crawler_stats["urls_processed"] % 10 == 0:
-                    logging.info(f"Crawler stats: {crawler_stats}")
-        
-        indexer_results = receive_indexer_results()
-        if indexer_results:
-            idle_counter = 0
-            for result in indexer_results:
+                # Show detailed stats once per batch to avoid log flooding
+                logger.info("Crawler stats: %s", crawler_stats)
+                continue
+            
+            for result in results:
                 indexer_stats["pages_indexed"] += 1
                 if "keywords_count" in result:
                     indexer_stats["keywords_indexed"] += result.get("keywords_count", 0)
                 
-                logging.info(f"Indexer result: {result.get('url', 'N/A')} indexed successfully")
+                logger.info("Indexer result: %s indexed successfully", result.get('url', 'N/A'))
                 if "title" in result:
-                    logging.info(f"Title: {result.get('title', 'N/A')}")
+                    logger.info("Title: %s", result.get('title', 'N/A'))
                 
                 if indexer_stats["pages_indexed"] % 10 == 0:
-                    logging.info(f"Indexer stats: {indexer_stats}")
+                    logger.info("Indexer stats: %s", indexer_stats)
         
-        # If neither queue had results, increment idle counter
-        if not crawler_results and not indexer_results:
-            idle_counter += 1
-            logging.info(f"No new results. Idle count: {idle_counter}")
+        # Tasks still waiting on politeness count as activity
+        if _scheduled_tasks:
+            last_activity = time.monotonic()
+        idle_seconds = time.monotonic() - last_activity
+        if not received_results:
+            logger.info("No new results. Idle for %.0f seconds", idle_seconds)
         
         # Exit after a period of inactivity
-        if idle_counter >= 30:
-            logging.info("No more crawling or indexing activity. Shutting down master.")
-            logging.info(f"Final crawler stats: {crawler_stats}")
-            logging.info(f"Final indexer stats: {indexer_stats}")
+        if idle_seconds >= IDLE_SHUTDOWN_SECONDS:
+            logger.info("No more crawling or indexing activity. Shutting down master.")
+            logger.info("Final crawler stats: %s", crawler_stats)
+            logger.info("Final indexer stats: %s", indexer_stats)
             break
 
-        time.sleep(5)
-
 def run_interactive():
     print("===== Distributed Web Crawler =====")
     
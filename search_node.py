@@ -1,67 +1,291 @@
-import json
-import argparse
+import os
+import orjson
+import base64
 import psycopg2
-from psycopg2.extras import DictCursor
-from datetime import datetime
+import psycopg2.extensions
+import psycopg2.errors
+from psycopg2.extras import DictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import lru_cache
 
-# PostgreSQL RDS Configuration
-DB_HOST = 'dbdistproj-new.c8v2o28aq6x6.us-east-1.rds.amazonaws.com'
-DB_PORT = 5432
-DB_NAME = 'dbdistproj'
-DB_USER = 'bialy'
-DB_PASSWORD = 'midomido15'
+# PostgreSQL RDS Configuration; the standard libpq environment variables override the defaults.
+# The password comes from PGPASSWORD or ~/.pgpass, never from source.
+DB_HOST = os.environ.get('PGHOST', 'dbdistproj-new.c8v2o28aq6x6.us-east-1.rds.amazonaws.com')
+DB_PORT = int(os.environ.get('PGPORT', 5432))
+DB_NAME = os.environ.get('PGDATABASE', 'dbdistproj')
+DB_USER = os.environ.get('PGUSER', 'bialy')
+DB_PASSWORD = os.environ.get('PGPASSWORD')  # None lets libpq fall back to ~/.pgpass
+DB_SSLMODE = os.environ.get('PGSSLMODE', 'require')
+
+# Connection options: TLS, a name that identifies this node in pg_stat_activity and
+# pg_stat_statements, and TCP keepalives so dead pooled connections are noticed
+DB_CONNECTION_OPTIONS = {
+    'sslmode': DB_SSLMODE,
+    'application_name': 'search_node',
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'tcp_user_timeout': 10000  # milliseconds
+}
+
+# PostgreSQL connections are pooled; the pool is created on first use
+DB_POOL_MIN_CONN = 1
+DB_POOL_MAX_CONN = 20
+_db_pool = None
+
+# Search counts are buffered in memory and written to search_statistics in batches,
+# keeping the write off the search path; a background thread flushes them periodically
+SEARCH_STATS_FLUSH_INTERVAL = 5  # seconds
+_pending_searches = Counter()
+_pending_searches_lock = threading.Lock()
+_stats_flusher = None
+
+# Document columns as returned to callers, aliased d: PostgreSQL splits keywords into a
+# list and formats the timestamps as ISO 8601, so rows need no per-field Python work
+DOCUMENT_COLUMNS = """
+    d.id, d.url, d.domain, d.title, d.summary, d.content_type,
+    coalesce(string_to_array(d.keywords, ','), '{}') AS keywords,
+    to_char(d.timestamp, 'YYYY-MM-DD"T"HH24:MI:SS.US') AS timestamp,
+    to_char(d.last_updated, 'YYYY-MM-DD"T"HH24:MI:SS.US') AS last_updated"""
+
+# Rows fetched per round trip when streaming from a named (server-side) cursor
+SERVER_CURSOR_ITERSIZE = 256
+
+# Recent search results, least recently used first: key -> (time.monotonic() when stored, result)
+SEARCH_CACHE_SIZE = 512
+SEARCH_CACHE_TTL = 30  # seconds
+_search_cache = OrderedDict()
+_search_cache_lock = threading.Lock()
+
+# Searched columns backed by pg_trgm GIN indexes, used by the word similarity fallback
+TRIGRAM_INDEXED_COLUMNS = ('title', 'summary', 'keywords')
+
+# Status views behind check_database_status, refreshed together; with pg_cron installed
+# create_status_views registers a job that runs the refresh on this schedule
+REFRESH_STATUS_VIEWS_SQL = (
+    "REFRESH MATERIALIZED VIEW CONCURRENTLY mv_content_type_counts; "
+    "REFRESH MATERIALIZED VIEW CONCURRENTLY mv_popular_searches"
+)
+STATUS_VIEWS_CRON_JOB = 'refresh-search-status-views'
+STATUS_VIEWS_CRON_SCHEDULE = '*/5 * * * *'  # every 5 minutes
+
+# Searches need the generated columns that --create-indexes adds; say so when they are missing
+SEARCH_MIGRATION_MISSING_MESSAGE = "Search columns are missing: run 'python3 search_node.py --create-indexes' once to add them"
+
+# Full-text search document over the searched columns; 'simple' keeps words unstemmed, as they are indexed
+SEARCH_TSV_EXPRESSION = "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(summary, '') || ' ' || coalesce(keywords, ''))"
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which statements it has already prepared"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+def execute_prepared(cursor, name, statement, params):
+    """Execute a named statement, preparing it on first use by this connection"""
+    conn = cursor.connection
+    if name not in conn.prepared_statements:
+        cursor.execute(f"PREPARE {name} AS {statement}")
+        conn.prepared_statements.add(name)
+    cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
 
 def connect_to_db():
-    """Connect to PostgreSQL RDS database"""
+    """Borrow a connection from the PostgreSQL RDS pool; hand it back with release_conn"""
+    global _db_pool
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-        print("Connected to PostgreSQL RDS")
-        return conn
+        if _db_pool is None:
+            _db_pool = ThreadedConnectionPool(
+                DB_POOL_MIN_CONN,
+                DB_POOL_MAX_CONN,
+                connection_factory=PreparingConnection,
+                host=DB_HOST,
+                port=DB_PORT,
+                database=DB_NAME,
+                user=DB_USER,
+                password=DB_PASSWORD,
+                **DB_CONNECTION_OPTIONS
+            )
+            print("Connected to PostgreSQL RDS")
+        return _db_pool.getconn()
     except Exception as e:
         print(f"Error connecting to PostgreSQL: {e}")
         return None
 
-def check_database_status(conn):
-    """Check database statistics and status"""
-    try:
-        cursor = conn.cursor(cursor_factory=DictCursor)
-
-        # Count total documents
-        cursor.execute("SELECT COUNT(*) FROM indexed_documents")
-        docs_count = cursor.fetchone()[0]
+def release_conn(conn):
+    """Return a connection to the pool, discarding it if it has died"""
+    # Discard anything left uncommitted so the next borrower starts with a clean transaction
+    if not conn.closed:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    _db_pool.putconn(conn, close=bool(conn.closed))
 
-        # Get status of indexed documents
+def create_search_indexes(conn):
+    """Add the full-text search column and create the GIN indexes used by search_documents"""
+    try:
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(f"""
+        ALTER TABLE indexed_documents ADD COLUMN IF NOT EXISTS search_tsv tsvector
+        GENERATED ALWAYS AS ({SEARCH_TSV_EXPRESSION}) STORED
+        """)
         cursor.execute("""
-        SELECT content_type, COUNT(*) as count 
-        FROM indexed_documents 
-        GROUP BY content_type 
-        ORDER BY count DESC
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_docs_search_tsv
+        ON indexed_documents USING GIN (search_tsv)
         """)
-        content_type_counts = cursor.fetchall()
-
-        # Get most recent document
+        # Title prefix searches; text_pattern_ops supports the ~>=~/~<~ range regardless of collation
         cursor.execute("""
-        SELECT url, last_updated 
-        FROM indexed_documents 
-        ORDER BY last_updated DESC 
-        LIMIT 1
+        ALTER TABLE indexed_documents ADD COLUMN IF NOT EXISTS title_lower text
+        GENERATED ALWAYS AS (lower(title)) STORED
         """)
-        recent_doc = cursor.fetchone()
+        cursor.execute("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_docs_title_lower_btree
+        ON indexed_documents (title_lower text_pattern_ops)
+        """)
+        # Newest-first lookups and ties between equally ranked matches
+        cursor.execute("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_docs_lastupd_id
+        ON indexed_documents (last_updated DESC, id DESC)
+        """)
+        for column in TRIGRAM_INDEXED_COLUMNS:
+            cursor.execute(f"""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_docs_{column}_trgm
+            ON indexed_documents USING GIN ({column} gin_trgm_ops)
+            """)
+        print("Search indexes created")
+        return True
+    except Exception as e:
+        print(f"Error creating search indexes: {e}")
+        return False
+    finally:
+        conn.autocommit = False
 
-        # Get popular search terms
+def create_status_views(conn):
+    """Create the materialized views check_database_status reads its aggregates from"""
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS mv_content_type_counts AS
+        SELECT content_type, COUNT(*) AS count
+        FROM indexed_documents
+        GROUP BY content_type
+        """)
         cursor.execute("""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS mv_popular_searches AS
         SELECT search_term, search_count
         FROM search_statistics
         ORDER BY search_count DESC
-        LIMIT 10
+        LIMIT 100
+        """)
+        
+        # REFRESH ... CONCURRENTLY needs a unique index on each view
+        cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_content_type_counts_content_type
+        ON mv_content_type_counts (content_type)
+        """)
+        cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_popular_searches_search_term
+        ON mv_popular_searches (search_term)
         """)
-        popular_searches = cursor.fetchall()
+        
+        # Keep the views fresh from inside the database when pg_cron is installed
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron')")
+        if cursor.fetchone()[0]:
+            cursor.execute(
+                "SELECT cron.schedule(%s, %s, %s)",
+                (STATUS_VIEWS_CRON_JOB, STATUS_VIEWS_CRON_SCHEDULE, REFRESH_STATUS_VIEWS_SQL)
+            )
+            print(f"Status views scheduled for refresh by pg_cron ('{STATUS_VIEWS_CRON_SCHEDULE}')")
+        else:
+            print("pg_cron is not installed; schedule 'search_node.py --refresh-stats' with cron instead")
+        
+        conn.commit()
+        print("Status views created")
+        return True
+    except Exception as e:
+        print(f"Error creating status views: {e}")
+        conn.rollback()
+        return False
+
+def refresh_status_views(conn):
+    """Recompute the status materialized views without blocking readers; run on a schedule when pg_cron is absent"""
+    try:
+        cursor = conn.cursor()
+        cursor.execute(REFRESH_STATUS_VIEWS_SQL)
+        conn.commit()
+        print("Status views refreshed")
+        return True
+    except Exception as e:
+        print(f"Error refreshing status views: {e}")
+        conn.rollback()
+        return False
+
+def check_database_status(conn, exact=False):
+    """Check database statistics and status; the document count is the planner's estimate unless exact"""
+    try:
+        cursor = conn.cursor()
+
+        if exact:
+            docs_count_query = "SELECT COUNT(*) AS docs_count FROM indexed_documents"
+        else:
+            # The estimate is -1 until the table has been vacuumed or analyzed
+            docs_count_query = """
+            SELECT CASE WHEN reltuples >= 0 THEN reltuples::bigint
+                ELSE (SELECT COUNT(*) FROM indexed_documents) END AS docs_count
+            FROM pg_class WHERE oid = 'indexed_documents'::regclass
+            """
+
+        # Read the aggregates from the status views, or compute them live until --create-indexes has run
+        cursor.execute("""
+        SELECT to_regclass('mv_content_type_counts') IS NOT NULL
+            AND to_regclass('mv_popular_searches') IS NOT NULL
+        """)
+        if cursor.fetchone()[0]:
+            content_types_source, popular_source = "mv_content_type_counts", "mv_popular_searches"
+        else:
+            print("Status views not found; computing live aggregates (run --create-indexes to create them)")
+            content_types_source = """(
+                SELECT content_type, COUNT(*) AS count
+                FROM indexed_documents
+                GROUP BY content_type
+            )"""
+            popular_source = "search_statistics"
+
+        # One round trip: the document count, content type distribution (as of the last
+        # view refresh), most recent document and popular search terms, the lists as JSON
+        cursor.execute(f"""
+        WITH docs AS (
+            {docs_count_query}
+        ), content_types AS (
+            SELECT coalesce(json_agg(t ORDER BY t.count DESC), '[]') AS content_type_counts
+            FROM {content_types_source} t
+        ), recent AS (
+            SELECT row_to_json(t) AS recent_doc
+            FROM (
+                SELECT url, last_updated
+                FROM indexed_documents
+                ORDER BY last_updated DESC
+                LIMIT 1
+            ) t
+        ), popular AS (
+            SELECT coalesce(json_agg(t ORDER BY t.search_count DESC), '[]') AS popular_searches
+            FROM (
+                SELECT search_term, search_count
+                FROM {popular_source}
+                ORDER BY search_count DESC
+                LIMIT 10
+            ) t
+        )
+        SELECT docs.docs_count, content_types.content_type_counts, recent.recent_doc, popular.popular_searches
+        FROM docs CROSS JOIN content_types CROSS JOIN popular
+        LEFT JOIN recent ON true
+        """)
+        docs_count, content_type_counts, recent_doc, popular_searches = cursor.fetchone()
 
         print("\nDatabase Status:")
         print(f"Total documents indexed: {docs_count}")
@@ -80,120 +304,334 @@ def check_database_status(conn):
         
         return {
             "docs_count": docs_count,
-            "content_type_counts": [dict(row) for row in content_type_counts],
-            "recent_doc": dict(recent_doc) if recent_doc else None,
-            "popular_searches": [dict(row) for row in popular_searches]
+            "content_type_counts": content_type_counts,
+            "recent_doc": recent_doc,
+            "popular_searches": popular_searches
         }
         
     except Exception as e:
         print(f"Error checking database status: {e}")
         return {}
 
-def search_documents(conn, query, page=1, results_per_page=10, domain_filter=None, content_type_filter=None):
-    """Search for documents containing the query term"""
+def encode_search_cursor(rank, last_updated, doc_id):
+    """Opaque keyset cursor naming the last row of a page"""
+    return base64.urlsafe_b64encode(orjson.dumps([rank, last_updated, doc_id])).decode()
+
+def decode_search_cursor(after):
+    """Unpack a cursor built by encode_search_cursor into (rank, last_updated, id)"""
+    rank, last_updated, doc_id = orjson.loads(base64.urlsafe_b64decode(after))
+    return rank, last_updated, doc_id
+
+def cached_search(key):
+    """Return the cached result for a search key if it is younger than SEARCH_CACHE_TTL, else None"""
+    with _search_cache_lock:
+        entry = _search_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if time.monotonic() - stored_at > SEARCH_CACHE_TTL:
+            del _search_cache[key]
+            return None
+        _search_cache.move_to_end(key)
+        return result
+
+def cache_search(key, result):
+    """Store a search result, evicting the least recently used one beyond SEARCH_CACHE_SIZE"""
+    with _search_cache_lock:
+        _search_cache[key] = (time.monotonic(), result)
+        _search_cache.move_to_end(key)
+        if len(_search_cache) > SEARCH_CACHE_SIZE:
+            _search_cache.popitem(last=False)
+
+# Match query per search mode and the number of parameters it takes. Each yields the
+# document columns plus a rank and the total match count, computed before the keyset
+# predicate and LIMIT.
+SEARCH_MATCH_QUERIES = {
+    # One GIN index lookup on the full-text column instead of three ILIKE scans. When no
+    # document matches word for word, fall back to pg_trgm word similarity (the trigram GIN
+    # indexes), which tolerates typos; the fallback is skipped by a one-time filter otherwise.
+    'text': ("""
+    WITH text_matches AS (
+        SELECT id, url, domain, title, summary, content_type, keywords, timestamp, last_updated,
+            ts_rank_cd(search_tsv, q) AS rank
+        FROM indexed_documents, plainto_tsquery('simple', $1) AS q
+        WHERE search_tsv @@ q{filters}
+    )
+    SELECT *, COUNT(*) OVER () AS total_count
+    FROM (
+        SELECT * FROM text_matches
+        UNION ALL
+        SELECT id, url, domain, title, summary, content_type, keywords, timestamp, last_updated,
+            GREATEST(word_similarity($1, title), word_similarity($1, summary), word_similarity($1, keywords)) AS rank
+        FROM indexed_documents
+        WHERE NOT EXISTS (SELECT 1 FROM text_matches) AND char_length($1) >= {min_fuzzy_length}
+            AND ($1 <% title OR $1 <% summary OR $1 <% keywords){filters}
+    ) matches
+    """, 1),
+    # Title prefix range on the text_pattern_ops B-tree; unranked, so newest first
+    'prefix': ("""
+    SELECT id, url, domain, title, summary, content_type, keywords, timestamp, last_updated,
+        0::real AS rank, COUNT(*) OVER () AS total_count
+    FROM indexed_documents
+    WHERE title_lower ~>=~ $1 AND title_lower ~<~ $2{filters}
+    """, 2),
+}
+
+# Shorter queries share too few trigrams with a misspelled word to fall back to similarity
+MIN_FUZZY_QUERY_LENGTH = 4
+
+# Queries with fewer characters than this, not counting '*' wildcards, would match most of the
+# table and cannot use the indexes, so they are rejected before reaching the database.
+# Queries ending in '*' with at least this many characters before it search title prefixes.
+MIN_QUERY_LENGTH = 3
+
+def is_searchable(query):
+    """Whether a query has enough non-wildcard characters to be run"""
+    return len(query.replace('*', '').strip()) >= MIN_QUERY_LENGTH
+
+@lru_cache(maxsize=None)
+def search_statement(mode, has_domain_filter, has_content_type_filter, has_cursor):
+    """Name, SQL and parameter count of the prepared search variant for a mode/filter/pagination combination"""
+    match_query, match_param_count = SEARCH_MATCH_QUERIES[mode]
+    placeholder = match_param_count + 1
+    
+    # Apply filters if provided
+    filters = ""
+    if has_domain_filter:
+        filters += f" AND domain = ${placeholder}"
+        placeholder += 1
+    if has_content_type_filter:
+        filters += f" AND content_type = ${placeholder}"
+        placeholder += 1
+    match_query = match_query.format(filters=filters, min_fuzzy_length=MIN_FUZZY_QUERY_LENGTH)
+    
+    statement = f"SELECT {DOCUMENT_COLUMNS}, d.rank, d.total_count FROM ({match_query}) d"
+    
+    # Seek past the previous page's last row; page/OFFSET is kept for callers without a cursor
+    if has_cursor:
+        statement += f" WHERE (d.rank, d.last_updated, d.id) < (${placeholder}::real, ${placeholder + 1}::timestamp, ${placeholder + 2})"
+        placeholder += 3
+    
+    # Add ordering and pagination
+    statement += f" ORDER BY d.rank DESC, d.last_updated DESC, d.id DESC LIMIT ${placeholder}"
+    if not has_cursor:
+        placeholder += 1
+        statement += f" OFFSET ${placeholder}"
+    
+    name = f"search_{mode}_{int(has_domain_filter)}{int(has_content_type_filter)}{int(has_cursor)}"
+    return name, statement, placeholder
+
+@lru_cache(maxsize=None)
+def search_json_statement(mode, has_domain_filter, has_content_type_filter, has_cursor):
+    """Name and SQL of a search variant that returns the whole api_search payload as one JSON value"""
+    name, statement, param_count = search_statement(mode, has_domain_filter, has_content_type_filter, has_cursor)
+    
+    # query, page and results_per_page follow the variant's own parameters
+    statement = f"""
+    SELECT json_build_object(
+        'query', ${param_count + 1}::text,
+        'page', ${param_count + 2}::integer,
+        'results_per_page', ${param_count + 3}::integer,
+        'total_results', coalesce(max(page.total_count), 0),
+        'next_cursor', CASE WHEN count(*) = ${param_count + 3} THEN translate(encode(convert_to(
+            (array_agg(json_build_array(page.rank, page.last_updated, page.id)::text
+                ORDER BY page.rank, page.last_updated, page.id))[1],
+            'UTF8'), 'base64'), E'+/\\n', '-_') END,
+        'results', coalesce(json_agg(json_build_object(
+            'id', page.id, 'url', page.url, 'domain', page.domain, 'title', page.title,
+            'summary', page.summary, 'content_type', page.content_type, 'keywords', page.keywords,
+            'timestamp', page.timestamp, 'last_updated', page.last_updated)
+            ORDER BY page.rank DESC, page.last_updated DESC, page.id DESC), '[]'::json)
+    )::text
+    FROM ({statement}) page
+    """
+    return f"{name}_json", statement
+
+def search_params(query, page, results_per_page, domain_filter, content_type_filter, after):
+    """Search mode and parameters for a search, in the order its statement variant numbers them"""
+    prefix = query[:-1].strip().lower() if query.endswith('*') else ''
+    if len(prefix) >= MIN_QUERY_LENGTH:
+        # Titles from the prefix up to, but excluding, the prefix with its last character incremented
+        mode = 'prefix'
+        params = [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+    else:
+        mode = 'text'
+        params = [query]
+    if domain_filter:
+        params.append(domain_filter)
+    if content_type_filter:
+        params.append(content_type_filter)
+    if after:
+        params.extend(decode_search_cursor(after))
+    params.append(results_per_page)
+    if not after:
+        params.append((page - 1) * results_per_page)
+    return mode, params
+
+def search_documents_json(conn, query, page=1, results_per_page=10, domain_filter=None, content_type_filter=None, after=None):
+    """Search like api_search, but have PostgreSQL build the JSON payload; returns it as a string"""
+    if not is_searchable(query):
+        return orjson.dumps(api_search(conn, query, page, results_per_page, domain_filter, content_type_filter, after)).decode()
+    
+    # Repeated searches are served from the cache, but still counted
+    key = ('json', query, page, results_per_page, domain_filter, content_type_filter, after)
+    payload = cached_search(key)
+    if payload is not None:
+        record_search(query)
+        return payload
+    
     try:
-        cursor = conn.cursor(cursor_factory=DictCursor)
+        cursor = conn.cursor()
         
-        # Base query
-        base_query = """
-        SELECT id, url, domain, title, summary, content_type, keywords, timestamp, last_updated
-        FROM indexed_documents
-        WHERE 
-            (title ILIKE %s OR
-            summary ILIKE %s OR
-            keywords ILIKE %s)
-        """
+        mode, params = search_params(query, page, results_per_page, domain_filter, content_type_filter, after)
+        params.extend([query, page, results_per_page])
+        name, statement = search_json_statement(mode, bool(domain_filter), bool(content_type_filter), bool(after))
+        execute_prepared(cursor, name, statement, params)
+        payload = cursor.fetchone()[0]  # Cast to text, so psycopg2 hands it over without decoding
         
-        # Apply filters if provided
-        params = [f'%{query}%', f'%{query}%', f'%{query}%']
+        cache_search(key, payload)
         
-        if domain_filter:
-            base_query += " AND domain = %s"
-            params.append(domain_filter)
-            
-        if content_type_filter:
-            base_query += " AND content_type = %s"
-            params.append(content_type_filter)
-            
-        # Add ordering and pagination
-        offset = (page - 1) * results_per_page
-        base_query += " ORDER BY last_updated DESC LIMIT %s OFFSET %s"
-        params.extend([results_per_page, offset])
+        # Record this search in statistics
+        record_search(query)
+        
+        return payload
         
-        # Execute search query
-        cursor.execute(base_query, params)
+    except Exception as e:
+        print(f"Error searching documents: {e}")
+        if isinstance(e, psycopg2.errors.UndefinedColumn):
+            print(SEARCH_MIGRATION_MISSING_MESSAGE)
+        return orjson.dumps({
+            'query': query,
+            'page': page,
+            'results_per_page': results_per_page,
+            'total_results': 0,
+            'next_cursor': None,
+            'results': []
+        }).decode()
+
+def search_documents(conn, query, page=1, results_per_page=10, domain_filter=None, content_type_filter=None, after=None):
+    """Search for documents containing the query term; returns (results, total, next_cursor)"""
+    if not is_searchable(query):
+        return [], 0, None
+    
+    # Repeated searches are served from the cache, but still counted
+    key = ('rows', query, page, results_per_page, domain_filter, content_type_filter, after)
+    cached = cached_search(key)
+    if cached is not None:
+        record_search(query)
+        return cached
+    
+    try:
+        cursor = conn.cursor(cursor_factory=DictCursor)
         
-        # Format results
+        mode, params = search_params(query, page, results_per_page, domain_filter, content_type_filter, after)
+        
+        # Execute the prepared search statement, so it is planned once per connection
+        name, statement, _ = search_statement(mode, bool(domain_filter), bool(content_type_filter), bool(after))
+        execute_prepared(cursor, name, statement, params)
+        
+        # Format results; every row carries the total match count
         results = []
+        total_results = 0
+        rank = None
         for row in cursor.fetchall():
-            # Convert datetime objects to ISO format for JSON serialization
             doc = dict(row)
-            if doc['timestamp']:
-                doc['timestamp'] = doc['timestamp'].isoformat()
-            if doc['last_updated']:
-                doc['last_updated'] = doc['last_updated'].isoformat()
-                
-            # Convert keywords string to list
-            if doc['keywords']:
-                doc['keywords'] = doc['keywords'].split(',')
-            else:
-                doc['keywords'] = []
-                
+            total_results = doc.pop('total_count')
+            rank = doc.pop('rank')
             results.append(doc)
         
-        # Get total count for pagination info
-        cursor.execute("SELECT COUNT(*) FROM indexed_documents WHERE title ILIKE %s OR summary ILIKE %s OR keywords ILIKE %s",
-                      (f'%{query}%', f'%{query}%', f'%{query}%'))
-        total_results = cursor.fetchone()[0]
+        # A full page may have more after it
+        next_cursor = None
+        if results and len(results) == results_per_page:
+            next_cursor = encode_search_cursor(rank, results[-1]['last_updated'], results[-1]['id'])
+        
+        cache_search(key, (results, total_results, next_cursor))
         
         # Record this search in statistics
-        record_search(conn, query)
+        record_search(query)
         
-        return results, total_results
+        return results, total_results, next_cursor
         
     except Exception as e:
         print(f"Error searching documents: {e}")
-        return [], 0
+        if isinstance(e, psycopg2.errors.UndefinedColumn):
+            print(SEARCH_MIGRATION_MISSING_MESSAGE)
+        return [], 0, None
 
-def record_search(conn, query):
-    """Record search term in search statistics"""
+def record_search(query):
+    """Count a search term; the count reaches search_statistics on the next flush"""
+    global _stats_flusher
+    
+    # Normalize query
+    normalized_query = query.lower().strip()
+    
+    with _pending_searches_lock:
+        _pending_searches[normalized_query] += 1
+        if _stats_flusher is None:
+            _stats_flusher = threading.Thread(target=flush_search_statistics_periodically, daemon=True)
+            _stats_flusher.start()
+
+def flush_search_statistics():
+    """Upsert all buffered search counts into search_statistics with a single autocommitted statement"""
+    with _pending_searches_lock:
+        pending = sorted(_pending_searches.items())  # Fixed row order avoids deadlocks between concurrent flushes
+        _pending_searches.clear()
+    if not pending:
+        return True
+    
+    conn = connect_to_db()
     try:
-        cursor = conn.cursor()
-        
-        # Normalize query
-        normalized_query = query.lower().strip()
+        if not conn:
+            raise psycopg2.OperationalError("no database connection")
         
-        cursor.execute("""
+        # One statement needs no BEGIN/COMMIT, so every term goes on one page; the server stamps last_searched
+        conn.autocommit = True
+        cursor = conn.cursor()
+        execute_values(cursor, """
         INSERT INTO search_statistics (search_term, search_count, last_searched)
-        VALUES (%s, 1, %s)
+        VALUES %s
         ON CONFLICT (search_term) DO UPDATE SET
-            search_count = search_statistics.search_count + 1,
-            last_searched = %s
-        """, (normalized_query, datetime.now(), datetime.now()))
-        
-        conn.commit()
+            search_count = search_statistics.search_count + EXCLUDED.search_count,
+            last_searched = EXCLUDED.last_searched
+        """, pending, template="(%s, %s, CURRENT_TIMESTAMP)", page_size=len(pending))
+        return True
     except Exception as e:
         print(f"Error recording search statistics: {e}")
-        conn.rollback()
+        # Keep the counts for the next flush
+        with _pending_searches_lock:
+            _pending_searches.update(dict(pending))
+        return False
+    finally:
+        if conn:
+            if not conn.closed:
+                conn.autocommit = False
+            release_conn(conn)
+
+def flush_search_statistics_periodically():
+    """Background loop flushing buffered search counts every SEARCH_STATS_FLUSH_INTERVAL seconds"""
+    while True:
+        time.sleep(SEARCH_STATS_FLUSH_INTERVAL)
+        flush_search_statistics()
 
 def get_popular_searches(conn, limit=10):
     """Get most popular search terms"""
     try:
-        cursor = conn.cursor(cursor_factory=DictCursor)
-        
-        cursor.execute("""
-        SELECT search_term, search_count, last_searched
-        FROM search_statistics
-        ORDER BY search_count DESC
-        LIMIT %s
-        """, (limit,))
-        
-        results = []
-        for row in cursor.fetchall():
-            item = dict(row)
-            if item['last_searched']:
-                item['last_searched'] = item['last_searched'].isoformat()
-            results.append(item)
+        # Server-side cursor: large limits are streamed in SERVER_CURSOR_ITERSIZE-row batches
+        with conn.cursor(name='popular_searches', cursor_factory=DictCursor) as cursor:
+            cursor.itersize = SERVER_CURSOR_ITERSIZE
+            cursor.execute("""
+            SELECT search_term, search_count, last_searched
+            FROM search_statistics
+            ORDER BY search_count DESC
+            LIMIT %s
+            """, (limit,))
+            
+            results = []
+            for row in cursor:
+                item = dict(row)
+                if item['last_searched']:
+                    item['last_searched'] = item['last_searched'].isoformat()
+                results.append(item)
             
         return results
     except Exception as e:
@@ -205,43 +643,39 @@ def get_document_by_url(conn, url):
     try:
         cursor = conn.cursor(cursor_factory=DictCursor)
         
-        cursor.execute("""
-        SELECT id, url, domain, title, summary, content_type, keywords, timestamp, last_updated
-        FROM indexed_documents
-        WHERE url = %s
+        cursor.execute(f"""
+        SELECT {DOCUMENT_COLUMNS}
+        FROM indexed_documents d
+        WHERE d.url = %s
         """, (url,))
         
         row = cursor.fetchone()
         if not row:
             return None
             
-        doc = dict(row)
-        # Format datetime objects
-        if doc['timestamp']:
-            doc['timestamp'] = doc['timestamp'].isoformat()
-        if doc['last_updated']:
-            doc['last_updated'] = doc['last_updated'].isoformat()
-            
-        # Convert keywords string to list
-        if doc['keywords']:
-            doc['keywords'] = doc['keywords'].split(',')
-        else:
-            doc['keywords'] = []
-            
-        return doc
+        return dict(row)
     except Exception as e:
         print(f"Error getting document by URL: {e}")
         return None
 
-def api_search(conn, query, page=1, results_per_page=10, domain=None, content_type=None):
+def api_search(conn, query, page=1, results_per_page=10, domain=None, content_type=None, after=None):
     """API endpoint for search functionality"""
-    results, total = search_documents(
+    if not is_searchable(query):
+        # Tell clients why there are no results
+        return {
+            'query': query,
+            'error': 'query too short',
+            'results': []
+        }
+    
+    results, total, next_cursor = search_documents(
         conn, 
         query, 
         page=page,
         results_per_page=results_per_page,
         domain_filter=domain,
-        content_type_filter=content_type
+        content_type_filter=content_type,
+        after=after
     )
     
     return {
@@ -249,6 +683,7 @@ def api_search(conn, query, page=1, results_per_page=10, domain=None, content_ty
         'page': page,
         'results_per_page': results_per_page,
         'total_results': total,
+        'next_cursor': next_cursor,
         'results': results
     }
 
@@ -260,65 +695,83 @@ def api_popular_searches(conn, limit=10):
         'popular_searches': popular
     }
 
-def api_stats(conn):
+def api_stats(conn, exact=False):
     """API endpoint for database statistics"""
-    stats = check_database_status(conn)
+    stats = check_database_status(conn, exact=exact)
     
     return {
         'stats': stats
     }
 
 def main():
+    # Imported here so that modules using the search functions as a library skip it
+    import argparse
     parser = argparse.ArgumentParser(description='Search node for distributed search engine')
     parser.add_argument('--status', action='store_true', help='Show database status')
+    parser.add_argument('--exact', action='store_true', help='With --status, count documents exactly instead of estimating')
     parser.add_argument('--search', type=str, help='Search term')
     parser.add_argument('--domain', type=str, help='Filter by domain')
     parser.add_argument('--content-type', type=str, help='Filter by content type')
     parser.add_argument('--page', type=int, default=1, help='Page number')
+    parser.add_argument('--after', type=str, help='Cursor from a previous page; takes precedence over --page')
     parser.add_argument('--limit', type=int, default=10, help='Results per page')
     parser.add_argument('--popular', action='store_true', help='Show popular searches')
     parser.add_argument('--url', type=str, help='Get document by URL')
     parser.add_argument('--json', action='store_true', help='Output in JSON format')
+    parser.add_argument('--create-indexes', action='store_true', help='Create the search indexes and status views')
+    parser.add_argument('--refresh-stats', action='store_true', help='Refresh the status views (run periodically)')
     
     args = parser.parse_args()
     
-    # Connect to PostgreSQL
+    # Borrow a pooled PostgreSQL connection
     conn = connect_to_db()
     if not conn:
         print("Failed to connect to database. Exiting.")
         return
     
     try:
-        if args.status:
+        if args.create_indexes:
+            # One-shot migration; adding the generated columns rewrites the table
+            create_search_indexes(conn)
+            create_status_views(conn)
+        
+        elif args.refresh_stats:
+            refresh_status_views(conn)
+        
+        elif args.status:
             # Show database status
-            stats = check_database_status(conn)
+            stats = check_database_status(conn, exact=args.exact)
             if args.json:
-                print(json.dumps(stats, indent=2))
+                print(orjson.dumps(stats, option=orjson.OPT_INDENT_2).decode())
         
         elif args.search:
             # Search for documents
             print(f"Searching for: '{args.search}'")
+            if not is_searchable(args.search) and not args.json:
+                print(f"Query too short: use at least {MIN_QUERY_LENGTH} characters besides '*'")
+                return
             
             if args.json:
-                # Return JSON response
-                results = api_search(
+                # PostgreSQL builds the JSON response; print it as is
+                print(search_documents_json(
                     conn, 
                     args.search, 
                     page=args.page,
                     results_per_page=args.limit,
-                    domain=args.domain,
-                    content_type=args.content_type
-                )
-                print(json.dumps(results, indent=2))
+                    domain_filter=args.domain,
+                    content_type_filter=args.content_type,
+                    after=args.after
+                ))
             else:
                 # Display search results in human-readable format
-                results, total = search_documents(
+                results, total, next_cursor = search_documents(
                     conn, 
                     args.search, 
                     page=args.page,
                     results_per_page=args.limit,
                     domain_filter=args.domain,
-                    content_type_filter=args.content_type
+                    content_type_filter=args.content_type,
+                    after=args.after
                 )
                 
                 if not results:
@@ -343,13 +796,16 @@ def main():
                         
                         print(f"   Last updated: {doc.get('last_updated', 'Unknown')}")
                         print("-" * 80)
+                    
+                    if next_cursor:
+                        print(f"Next page: --after {next_cursor}")
                         
         elif args.popular:
             # Show popular searches
             popular = get_popular_searches(conn, args.limit)
             
             if args.json:
-                print(json.dumps({'popular_searches': popular}, indent=2))
+                print(orjson.dumps({'popular_searches': popular}, option=orjson.OPT_INDENT_2).decode())
             else:
                 print(f"Top {len(popular)} popular searches:")
                 for i, item in enumerate(popular, 1):
@@ -361,7 +817,7 @@ def main():
             doc = get_document_by_url(conn, args.url)
             
             if args.json:
-                print(json.dumps({'document': doc}, indent=2))
+                print(orjson.dumps({'document': doc}, option=orjson.OPT_INDENT_2).decode())
             else:
                 if not doc:
                     print(f"No document found with URL: {args.url}")
@@ -379,8 +835,9 @@ def main():
             parser.print_help()
     
     finally:
-        # Always close database connection
-        conn.close()
+        # Hand the connection back to the pool, then write any buffered search counts
+        release_conn(conn)
+        flush_search_statistics()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
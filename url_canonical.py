@@ -0,0 +1,48 @@
+import hashlib
+from functools import lru_cache
+
+# Ports implied by the scheme; dropped from canonical URLs
+DEFAULT_PORTS = {'http': ':80', 'https': ':443'}
+
+def canonicalize_url(url):
+    """Return (canonical_url, host): the URL with the host lowercased, default port and fragment dropped and
+    query params sorted, and that host; both are keys only, tasks keep the URL as written"""
+    url = url.strip()
+    fragment_start = url.find('#')
+    if fragment_start != -1:
+        url = url[:fragment_start]
+
+    scheme_end = url.find('://')
+    if scheme_end == -1:
+        return url, ''
+    scheme = url[:scheme_end].lower()
+
+    # The host runs up to the first '/' or '?' after the scheme
+    host_start = scheme_end + 3
+    host_end = len(url)
+    for separator in '/?':
+        position = url.find(separator, host_start)
+        if position != -1 and position < host_end:
+            host_end = position
+    host = url[host_start:host_end].lower()
+    default_port = DEFAULT_PORTS.get(scheme)
+    if default_port and host.endswith(default_port):
+        host = host[:-len(default_port)]
+
+    path = url[host_end:]
+    query_start = path.find('?')
+    query = ''
+    if query_start != -1:
+        query = '&'.join(sorted(param for param in path[query_start + 1:].split('&') if param))
+        path = path[:query_start]
+
+    canonical_url = f"{scheme}://{host}{path or '/'}"
+    if query:
+        canonical_url = f"{canonical_url}?{query}"
+    return canonical_url, host
+
+@lru_cache(maxsize=8192)
+def generate_url_hash(url):
+    """SQS deduplication ID shared by the master and crawlers: 128-bit BLAKE2b of the canonical URL,
+    so every spelling of one URL gets the same ID"""
+    return hashlib.blake2b(canonicalize_url(url)[0].encode('utf-8'), digest_size=16).hexdigest()